@@ -0,0 +1,145 @@
+import logging
+import numpy as np
+from get_h import get_strickler
+from cross_section import CrossSection, trapezoid_points
+
+
+class Reach:
+    def __init__(self, sections, river_stations, lengths, expansion=0.3, contraction=0.1, g=9.81, **kwargs):
+        # steady 1d reach of CrossSection objects with HEC-RAS style river stations (higher = upstream),
+        # lengths (m) from every section to the next downstream section and the roughness (n_m, k_st
+        # or D_90 as in calc_discharge2) as one value or one value per section
+        order = np.argsort(-np.asarray(river_stations, dtype=float), kind="stable")
+        self.sections = [sections[i] for i in order]
+        self.river_stations = np.asarray(river_stations)[order]
+        self.lengths = np.broadcast_to(np.asarray(lengths, dtype=float), order.shape)[order]
+        self.k_st = np.broadcast_to(np.asarray(get_strickler(**kwargs), dtype=float), order.shape)[order]
+        self.expansion = expansion
+        self.contraction = contraction
+        self.g = g
+        self.results = {}
+
+    def get_hydraulics(self, i, wse, Q):
+        # hydraulic properties of section i for water surface elevations wse and discharges Q
+        section = self.sections[i]
+        A, P, T = section.get_properties(wse - section.z_min)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            R = A / P
+            u = Q / A
+            S_f = (Q / (self.k_st[i] * A * R ** (2 / 3))) ** 2
+        return {"A": A, "P": P, "T": T, "R": R, "u": u, "S_f": S_f, "H": wse + u ** 2 / (2 * self.g)}
+
+    def energy_residual(self, i, wse, Q, down):
+        # energy balance between section i and the next downstream section (down = its hydraulics):
+        # wse + u^2/2g - (H_down + L * mean friction slope + expansion or contraction loss)
+        up = self.get_hydraulics(i, wse, Q)
+        velocity_head = up["H"] - wse
+        velocity_head_down = down["H"] - down["wse"]
+        # accelerating flow (higher downstream velocity head) is a contraction, decelerating flow an expansion
+        coefficient = np.where(velocity_head_down > velocity_head, self.contraction, self.expansion)
+        loss = self.lengths[i] * (up["S_f"] + down["S_f"]) / 2 + coefficient * np.abs(velocity_head - velocity_head_down)
+        return up["H"] - down["H"] - loss
+
+    def solve_profiles(self, Q, profiles=None, downstream_slope=None, downstream_wse=None,
+                       tolerance=10**-3, max_iterations=50):
+        # subcritical standard-step water surface profiles for an array of discharges Q (one profile each)
+        # downstream boundary: normal depth for downstream_slope (m/m) or known water surface elevations
+        # the energy balance of every section is solved for all profiles at once (Illinois regula falsi
+        # between critical depth and a depth with positive residual); profiles without subcritical
+        # solution are set to critical depth like in HEC-RAS
+        Q = np.atleast_1d(np.asarray(Q, dtype=float))
+        profiles = np.asarray(profiles if profiles is not None else ["PF %i" % (i + 1) for i in range(Q.size)])
+        n_sections = len(self.sections)
+        wse = np.full((n_sections, Q.size), np.nan)
+        wse_critical = np.full((n_sections, Q.size), np.nan)
+        for i, section in enumerate(self.sections):
+            wse_critical[i] = section.z_min + section.solve_critical_depth(Q)
+
+        last = self.sections[-1]
+        if downstream_wse is not None:
+            wse[-1] = np.broadcast_to(np.asarray(downstream_wse, dtype=float), Q.shape)
+        elif downstream_slope is not None:
+            wse[-1] = last.z_min + last.solve_normal_depth(Q, downstream_slope, k_st=self.k_st[-1])[0]
+        else:
+            raise ValueError("Define the downstream boundary with downstream_slope or downstream_wse.")
+        wse[-1] = np.fmax(wse[-1], wse_critical[-1])
+
+        n_critical = 0
+        for i in range(n_sections - 2, -1, -1):
+            down = self.get_hydraulics(i + 1, wse[i + 1], Q)
+            down["wse"] = wse[i + 1]
+            low = wse_critical[i]
+            f_low = self.energy_residual(i, low, Q, down)
+            # upper bracket: raise the water surface from the downstream energy level until the residual > 0
+            high = np.fmax(down["H"], low) + tolerance
+            f_high = self.energy_residual(i, high, Q, down)
+            for _ in range(60):
+                short = f_high <= 0
+                if not short.any():
+                    break
+                high = np.where(short, high + 2 * (high - low), high)
+                f_high = np.where(short, self.energy_residual(i, high, Q, down), f_high)
+            critical = f_low >= 0
+            n_critical += int(np.count_nonzero(critical))
+            side = np.zeros(Q.shape, dtype=int)
+            for _ in range(max_iterations):
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    new = high - f_high * (high - low) / (f_high - f_low)
+                new = np.where(np.isfinite(new), new, (low + high) / 2)
+                f_new = self.energy_residual(i, new, Q, down)
+                positive = f_new > 0
+                # Illinois modification: halve the residual of the end point that was kept twice
+                f_low = np.where(positive, np.where(side == -1, f_low / 2, f_low), f_new)
+                f_high = np.where(positive, f_new, np.where(side == 1, f_high / 2, f_high))
+                low, high = np.where(positive, low, new), np.where(positive, new, high)
+                side = np.where(positive, -1, 1)
+                if np.all((high - low < tolerance) | critical | (np.abs(f_new) < tolerance / 10)):
+                    break
+            wse[i] = np.where(critical, wse_critical[i], np.where(np.abs(f_new) < tolerance / 10, new, (low + high) / 2))
+        if n_critical:
+            logging.warning("BACKWATER: %i SECTION PROFILES WITHOUT SUBCRITICAL SOLUTION SET TO CRITICAL DEPTH" % n_critical)
+
+        self.results = {"profiles": profiles, "Q": Q, "wse": wse, "wse_critical": wse_critical}
+        return self.results
+
+    def get_hec_data(self):
+        # HEC-RAS style profile table (one row per river station and profile) with the columns that
+        # calculate_mpm reads, e.g., calculate_mpm(reach.get_hec_data(), D_char)
+        import pandas as pd
+        if not self.results:
+            raise ValueError("Run solve_profiles before get_hec_data.")
+        Q, wse = self.results["Q"], self.results["wse"]
+        columns = {name: [] for name in ["Min Ch El", "W.S. Elev", "Crit W.S.", "E.G. Elev", "E.G. Slope",
+                                         "Vel Chnl", "Flow Area", "Top Width", "Froude # Chl", "Hydr Depth",
+                                         "Hydr Radius"]}
+        for i, section in enumerate(self.sections):
+            hydraulics = self.get_hydraulics(i, wse[i], Q)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                hydraulic_depth = hydraulics["A"] / hydraulics["T"]
+            columns["Min Ch El"].append(np.full(Q.size, section.z_min))
+            columns["W.S. Elev"].append(wse[i])
+            columns["Crit W.S."].append(self.results["wse_critical"][i])
+            columns["E.G. Elev"].append(hydraulics["H"])
+            columns["E.G. Slope"].append(hydraulics["S_f"])
+            columns["Vel Chnl"].append(hydraulics["u"])
+            columns["Flow Area"].append(hydraulics["A"])
+            columns["Top Width"].append(hydraulics["T"])
+            columns["Froude # Chl"].append(hydraulics["u"] / np.sqrt(self.g * hydraulic_depth))
+            columns["Hydr Depth"].append(hydraulic_depth)
+            columns["Hydr Radius"].append(hydraulics["R"])
+        hec_data = pd.DataFrame({"River Sta": np.repeat(self.river_stations, Q.size),
+                                 "Profile": np.tile(self.results["profiles"], len(self.sections)),
+                                 "Q Total": np.tile(Q, len(self.sections))})
+        for name, values in columns.items():
+            hec_data[name] = np.concatenate(values)
+        return hec_data
+
+
+if __name__ == '__main__':
+    # 2 km trapezoidal reach (S = 0.001) with a weir raising the downstream water surface
+    stations = np.arange(2000.0, -1.0, -100.0)
+    sections = [CrossSection(x, z + 0.001 * station) for station, (x, z) in
+                zip(stations, [trapezoid_points(b=5.1, m_bank=2.5, height=5.0)] * stations.size)]
+    reach = Reach(sections, stations, lengths=100.0, k_st=30)
+    reach.solve_profiles([5.0, 15.5, 40.0], profiles=["Q mean", "HQ2", "HQ100"], downstream_wse=3.5)
+    print(reach.get_hec_data().head(9))
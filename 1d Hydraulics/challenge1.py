@@ -2,13 +2,109 @@
 # based on flow velocity and water depth. For discharge, the function should be able to
 # use either trapezoidal, rectangular or circular cross-sections.
 
+import numpy as np
+
+# regime codes of classify_flow (-1 = undefined for NaN input, e.g., dry or zero-depth rows)
+REYNOLDS_REGIMES = ["laminar", "transitional", "turbulent"]
+FROUDE_REGIMES = ["subcritical", "critical", "supercritical"]
+
+
+def calc_flow(velocity, area):
+    """
+    :param velocity: flow velocity (m/s), float or numpy array
+    :param area: cross-section area (m2), float or numpy array
+    :return: discharge (m3/s)
+    """
+    return np.asarray(velocity, dtype=float) * np.asarray(area, dtype=float)
+
+
+def calc_reynolds(velocity, length, nu=10**-6):
+    return np.asarray(velocity, dtype=float) * np.asarray(length, dtype=float) / nu
+
+
+def calc_froude(velocity, flow_depth, g=9.81):
+    # u / sqrt(g * h) (flow_depth is the hydraulic depth A / T for non-rectangular sections)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.asarray(velocity, dtype=float) / np.sqrt(g * np.asarray(flow_depth, dtype=float))
+
+
+def get_reynolds_regime(re):
+    # 0 = laminar (Re < 2300), 1 = transitional (2300 <= Re <= 4000), 2 = turbulent (Re > 4000),
+    # -1 = undefined (NaN Re)
+    re = np.asarray(re, dtype=float)
+    return np.where(np.isnan(re), -1, (re >= 2300).astype(np.int8) + (re > 4000)).astype(np.int8)
+
+
+def get_froude_regime(froude, critical_band=0.05):
+    # 0 = subcritical, 1 = critical (|Fr - 1| <= critical_band), 2 = supercritical, -1 = undefined (NaN Fr)
+    froude = np.asarray(froude, dtype=float)
+    return np.select([np.isnan(froude), froude > 1 + critical_band, froude >= 1 - critical_band],
+                     [-1, 2, 1], 0).astype(np.int8)
+
+
+def get_section_area(shape, base, height=None, surface=None):
+    """
+    :param shape: "trapezoid", "triangular" or "circular" (full pipe) or a numpy array of these names
+    :param base: base length (m) or diameter (m) of circular sections
+    :param height: height (m) of trapezoid and triangular sections
+    :param surface: surface length (m) of trapezoid sections
+    :return: cross-section area (m2) and flow depth (m) like the prompts of this script
+    """
+    shape = np.asarray(shape)
+    base = np.asarray(base, dtype=float)
+    height = np.asarray(height if height is not None else np.nan, dtype=float)
+    surface = np.asarray(surface if surface is not None else np.nan, dtype=float)
+    area = np.select([shape == "trapezoid", shape == "triangular", shape == "circular"],
+                     [(base + surface) / 2 * height, base * height / 2, base ** 2 / 4 * np.pi], np.nan)
+    flow_depth = np.where(shape == "circular", base, height)
+    return area, flow_depth
+
+
+def calc_critical_depth(Q, b, m_bank=0.0, g=9.81, tolerance=10**-6):
+    # critical depth (m) of trapezoidal (m_bank = 0: rectangular, b = 0: triangular) channels where
+    # Q^2 * T / (g * A^3) = 1; Newton iteration from the rectangular solution with the mean width
+    Q, b, m_bank = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (Q, b, m_bank)])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        h = np.where(b > 0, (Q ** 2 / (g * b ** 2)) ** (1 / 3), (2 * Q ** 2 / (g * m_bank ** 2)) ** (1 / 5))
+        for _ in range(50):
+            A = h * (b + m_bank * h)
+            T = b + 2 * m_bank * h
+            F = Q ** 2 * T - g * A ** 3
+            dF_dh = 2 * m_bank * Q ** 2 - 3 * g * A ** 2 * T
+            step = F / dF_dh
+            h = h - step
+            if not np.any(np.abs(step) > tolerance):
+                break
+    h = np.where((Q > 0) & (h > 0), h, np.nan)
+    return float(h) if h.ndim == 0 else h
+
+
+def classify_flow(velocity, flow_depth, b, m_bank=0.0, length=None, nu=10**-6, g=9.81, critical_band=0.05):
+    # discharge, Reynolds and Froude numbers, regime codes (see REYNOLDS_REGIMES and FROUDE_REGIMES) and
+    # critical depth for arrays of velocity (m/s) and water depth (m) in trapezoidal channels (bottom
+    # width b, bank slope m_bank); Re uses length or else the hydraulic radius; returns a dict of arrays
+    u, h, b, m_bank = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (velocity, flow_depth, b, m_bank)])
+    area = h * (b + m_bank * h)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if length is None:
+            length = area / (b + 2 * h * np.sqrt(m_bank ** 2 + 1))
+        hydraulic_depth = area / (b + 2 * m_bank * h)
+    Q = calc_flow(u, area)
+    re = calc_reynolds(u, length, nu=nu)
+    froude = calc_froude(u, hydraulic_depth, g=g)
+    return {"Q": Q, "Re": re, "Fr": froude,
+            "reynolds_regime": get_reynolds_regime(re),
+            "froude_regime": get_froude_regime(froude, critical_band=critical_band),
+            "h_crit": calc_critical_depth(Q, b, m_bank, g=g)}
+
+
 def flow_calculator(velocity, area):
     """
     :param velocity: flow velocity of water
     :param area: area of cross-section
     :return: returns flow
     """
-    flow = velocity * area
+    flow = float(calc_flow(velocity, area))
     if flow > 0.01:
         return f"{round(flow,4)} m3/s"
     else:
@@ -17,17 +113,13 @@ def flow_calculator(velocity, area):
 
 
 def reynolds_calculator(velocity, length, nu=10**-6):
-    re = round(velocity * length / nu, 5)
-    if re < 2300:
-        return f"{re} (laminar)"
-    elif 2300 <= re <= 4000:
-        return f"{re} (transitional)"
-    else:
-        return f"{re} (turbulent)"
+    re = round(float(calc_reynolds(velocity, length, nu=nu)), 5)
+    regime = int(get_reynolds_regime(re))
+    return f"{re} ({REYNOLDS_REGIMES[regime] if regime >= 0 else 'undefined'})"
 
 
 def froude_calculator(velocity, flow_depth, g=9.81):
-    froude = velocity / ((flow_depth * g)**1/2)
+    froude = float(calc_froude(velocity, flow_depth, g=g))
     return froude
 
 def get_numeric_input(prompt):
@@ -49,33 +141,34 @@ def get_shape_input():
         else:
             print("Invalid shape selection! Please choose trapezoid, triangular, or circular.")
 
-# Main program
-shape = get_shape_input()
+if __name__ == "__main__":
+    # Main program
+    shape = get_shape_input()
 
-if shape == "trapezoid":
-    base = get_numeric_input("Enter a base length (m): ")
-    height = get_numeric_input("Enter a height (m): ")
-    surface = get_numeric_input("Enter a surface length (m): ")
-    area = (base + surface) / 2 * height
-    flow_depth = height
+    if shape == "trapezoid":
+        base = get_numeric_input("Enter a base length (m): ")
+        height = get_numeric_input("Enter a height (m): ")
+        surface = get_numeric_input("Enter a surface length (m): ")
+        area = (base + surface) / 2 * height
+        flow_depth = height
 
-elif shape == "triangular":
-    base = get_numeric_input("Enter a base length (m): ")
-    height = get_numeric_input("Enter a height (m): ")
-    area = base * height / 2
-    flow_depth = height
+    elif shape == "triangular":
+        base = get_numeric_input("Enter a base length (m): ")
+        height = get_numeric_input("Enter a height (m): ")
+        area = base * height / 2
+        flow_depth = height
 
-elif shape == "circular":
-    base = get_numeric_input("Enter a diameter (m): ")
-    area = (base ** 2 / 4) * 3.1415
-    flow_depth = base
+    elif shape == "circular":
+        base = get_numeric_input("Enter a diameter (m): ")
+        area = (base ** 2 / 4) * 3.1415
+        flow_depth = base
 
-else:
-    print("Invalid shape selection")
-    exit()
+    else:
+        print("Invalid shape selection")
+        exit()
 
 
-velocity = get_numeric_input("Enter a flow velocity (m/s): ")
+    velocity = get_numeric_input("Enter a flow velocity (m/s): ")
 
 
-print(f"Flow: {flow_calculator(velocity, area)}, Reynolds number: {reynolds_calculator(velocity, base)}, Froude number: {round(froude_calculator(velocity, flow_depth),4)}")
+    print(f"Flow: {flow_calculator(velocity, area)}, Reynolds number: {reynolds_calculator(velocity, base)}, Froude number: {round(froude_calculator(velocity, flow_depth),4)}")
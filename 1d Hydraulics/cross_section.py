@@ -0,0 +1,164 @@
+import numpy as np
+from get_h import get_strickler
+
+
+def trapezoid_points(b, m_bank, height):
+    # station-elevation points of a trapezoidal channel (bottom width b, bank slope m_bank, bank height)
+    stations = [0.0, m_bank * height, m_bank * height + b, 2 * m_bank * height + b]
+    elevations = [height, 0.0, 0.0, height]
+    return np.array(stations, dtype=float), np.array(elevations, dtype=float)
+
+
+class CrossSection:
+    def __init__(self, stations, elevations, g=9.81):
+        # surveyed cross-section from station (m) - elevation (m) points ordered from left to right bank,
+        # e.g., a compound channel with floodplains; all points below the water surface are wetted and
+        # water above the lower end point is confined by vertical walls at the end stations
+        # between two successive point elevations, the top width and the wetted perimeter change linearly
+        # and the area quadratically with the water level, so that A, P and T are tabulated at the point
+        # elevations (levels) in one sorted sweep and interpolated exactly at any depth
+        self.stations = np.asarray(stations, dtype=float)
+        self.elevations = np.asarray(elevations, dtype=float)
+        if self.stations.size < 2 or self.stations.size != self.elevations.size:
+            raise ValueError("A cross-section needs at least two station-elevation points of equal number.")
+        self.g = g
+        self.z_min = float(self.elevations.min())
+        self.levels = np.array([])
+        self.build()
+
+    def build(self):
+        x0, x1 = self.stations[:-1], self.stations[1:]
+        z_low = np.minimum(self.elevations[:-1], self.elevations[1:])
+        z_high = np.maximum(self.elevations[:-1], self.elevations[1:])
+        width = np.abs(x1 - x0)
+        length = np.hypot(x1 - x0, z_high - z_low)
+        sloped = z_high > z_low
+        rise = np.where(sloped, z_high - z_low, 1.0)
+
+        # events: sloped segments add width and perimeter at a constant rate per m of rise between z_low and
+        # z_high, flat segments add them at once and the walls at the end points add 1 m perimeter per m
+        event_z = np.concatenate([z_low[sloped], z_high[sloped], z_low[~sloped], self.elevations[[0, -1]]])
+        event_rate_T = np.concatenate([width[sloped] / rise[sloped], -width[sloped] / rise[sloped],
+                                       np.zeros(np.count_nonzero(~sloped) + 2)])
+        event_rate_P = np.concatenate([length[sloped] / rise[sloped], -length[sloped] / rise[sloped],
+                                       np.zeros(np.count_nonzero(~sloped)), np.ones(2)])
+        event_jump = np.concatenate([np.zeros(2 * np.count_nonzero(sloped)), width[~sloped], np.zeros(2)])
+
+        self.levels, index = np.unique(event_z, return_inverse=True)
+        n = self.levels.size
+        self.rate_T = np.cumsum(np.bincount(index, weights=event_rate_T, minlength=n))
+        self.rate_P = np.cumsum(np.bincount(index, weights=event_rate_P, minlength=n))
+        jump = np.cumsum(np.bincount(index, weights=event_jump, minlength=n))
+        dz = np.diff(self.levels)
+        # top width, wetted perimeter and area at the levels (flat segments at a level are wetted)
+        self.T = np.concatenate([[0.0], np.cumsum(self.rate_T[:-1] * dz)]) + jump
+        self.P = np.concatenate([[0.0], np.cumsum(self.rate_P[:-1] * dz)]) + jump
+        self.A = np.concatenate([[0.0], np.cumsum(self.T[:-1] * dz + 0.5 * self.rate_T[:-1] * dz ** 2)])
+
+    def get_properties(self, h):
+        # flow area A (m2), wetted perimeter P (m) and top width T (m) for water depths h (m) above the
+        # lowest point (binary search for the level below the water surface; NaN for h < 0)
+        h = np.asarray(h, dtype=float)
+        wse = self.z_min + np.where(h >= 0, h, np.nan)
+        k = np.clip(np.searchsorted(self.levels, wse, side="right") - 1, 0, self.levels.size - 1)
+        dy = wse - self.levels[k]
+        T = self.T[k] + self.rate_T[k] * dy
+        P = self.P[k] + self.rate_P[k] * dy
+        A = self.A[k] + self.T[k] * dy + 0.5 * self.rate_T[k] * dy ** 2
+        return A, P, T
+
+    def get_hydraulic_radius(self, h):
+        A, P, T = self.get_properties(h)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(P > 0, A / P, 0.0)
+
+    def get_hydraulic_depth(self, h):
+        A, P, T = self.get_properties(h)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(T > 0, A / T, 0.0)
+
+    def calc_discharge(self, h, S, **kwargs):
+        # Gauckler-Manning-Strickler discharge like calc_discharge2 (roughness: n_m, k_st or D_90)
+        A, P, T = self.get_properties(h)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            R = np.where(P > 0, A / P, 0.0)
+        return get_strickler(**kwargs) * np.sqrt(S) * R ** (2 / 3) * A
+
+    def calc_froude(self, Q, h):
+        # Froude number u / sqrt(g * A / T) with the hydraulic depth A / T
+        A, P, T = self.get_properties(h)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return Q / A / np.sqrt(self.g * A / T)
+
+    def solve_critical_depth(self, Q, tolerance=10**-4):
+        # critical depths (Fr = 1, i.e., Q^2 * T / (g * A^3) = 1) for an array of Q by bisection
+        # between the lowest point and a depth with Fr < 1 (NaN for Q <= 0)
+        Q = np.asarray(Q, dtype=float)
+        low = np.zeros(Q.shape)
+        high = np.full(Q.shape, max(float(self.elevations.max()) - self.z_min, 0.01))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for _ in range(100):
+                supercritical = self.calc_froude(Q, high) > 1
+                if not supercritical.any():
+                    break
+                high = np.where(supercritical, 2 * high, high)
+            while np.nanmax(high - low, initial=0.0) > tolerance:
+                h = (low + high) / 2
+                supercritical = self.calc_froude(Q, h) > 1
+                low = np.where(supercritical, h, low)
+                high = np.where(supercritical, high, h)
+        h_c = np.where(Q > 0, (low + high) / 2, np.nan)
+        return float(h_c) if h_c.ndim == 0 else h_c
+
+    def solve_normal_depth(self, Q, S, tolerance=10**-3, max_iterations=100, **kwargs):
+        # normal depths for arrays of Q and S like get_h.solve_normal_depth; Newton steps use
+        # dQ/dh = Q * (5/3 * T / A - 2/3 * dP/dh / P) and fall back to bisection if they leave the
+        # bracket of the solution (e.g., where the wetted perimeter jumps at flat floodplains)
+        Q, S, k_st = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (Q, S, get_strickler(**kwargs))])
+        valid = (Q > 0) & (S > 0) & (k_st > 0)
+        h = np.full(Q.shape, np.nan)
+        eps = np.full(Q.shape, np.nan)
+        iterations = np.zeros(Q.shape, dtype=int)
+        active = np.flatnonzero(valid)
+        Qa, Sa, ka = Q.flat[active], S.flat[active], k_st.flat[active]
+
+        # upper bracket: double the depth from the section height until the discharge is large enough
+        high = np.full(active.size, max(float(self.elevations.max()) - self.z_min, 0.01))
+        for _ in range(100):
+            short = self.calc_discharge(high, Sa, k_st=ka) < Qa
+            if not short.any():
+                break
+            high[short] *= 2
+        low = np.zeros(active.size)
+        ha = high / 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for i in range(max_iterations + 1):
+                A, P, T = self.get_properties(ha)
+                Qk = ka * np.sqrt(Sa) * (A / P) ** (2 / 3) * A
+                eps.flat[active] = np.abs(Qa - Qk) / Qa
+                h.flat[active] = ha
+                iterations.flat[active] = i
+                keep = eps.flat[active] > tolerance
+                if i == max_iterations or not keep.any():
+                    break
+                active, Qa, Sa, ka, low, high, ha, Qk, A, P, T = (
+                    x[keep] for x in (active, Qa, Sa, ka, low, high, ha, Qk, A, P, T))
+                low = np.where(Qk < Qa, ha, low)
+                high = np.where(Qk > Qa, ha, high)
+                k = np.clip(np.searchsorted(self.levels, self.z_min + ha, side="right") - 1, 0, self.levels.size - 1)
+                dQ_dh = Qk * (5 / 3 * T / A - 2 / 3 * self.rate_P[k] / P)
+                step = ha - (Qk - Qa) / dQ_dh
+                ha = np.where((step > low) & (step < high), step, (low + high) / 2)
+        if h.ndim == 0:
+            return float(h), float(eps), int(iterations)
+        return h, eps, iterations
+
+
+if __name__ == '__main__':
+    # trapezoidal channel of get_h.py and a compound channel with floodplains
+    section = CrossSection(*trapezoid_points(b=5.1, m_bank=2.5, height=5.0))
+    print(section.solve_normal_depth(15.5, 0.005, k_st=20))
+    compound = CrossSection([0.0, 0.01, 100.0, 102.0, 118.0, 120.0, 220.0, 220.01],
+                            [5.0, 3.0, 2.0, 0.0, 0.0, 2.0, 2.5, 5.0])
+    h_n = compound.solve_normal_depth([5.0, 50.0, 500.0], 0.001, n_m=0.035)[0]
+    print(h_n, compound.calc_froude([5.0, 50.0, 500.0], h_n))
@@ -1,4 +1,6 @@
+import functools
 import math
+import numpy as np
 
 
 def calc_discharge(b, h, k_st, m_bank, S):
@@ -42,6 +44,131 @@ def interpolate_h(Q, b, m_bank, S):
     return h, eps, Qk, iteration_count
 
 
+def get_strickler(**kwargs):
+    # Strickler k_st from n_m (Manning's n), D_90 (m) or k_st keyword arguments like calc_discharge2
+    k_st = None
+    for k in kwargs.items():
+        if "n_m" in k[0]:
+            k_st = 1 / np.asarray(k[1], dtype=float)
+        if "D_90" in k[0]:
+            k_st = 26 / np.asarray(k[1], dtype=float)**(1/6)
+        if "k_st" in k[0]:
+            k_st = np.asarray(k[1], dtype=float)
+    if k_st is None:
+        raise ValueError("Define the roughness with n_m, k_st or D_90.")
+    return k_st
+
+
+def solve_normal_depth(Q, b, m_bank, S, h0=None, tolerance=10**-3, max_iterations=100, **kwargs):
+    # Newton iteration of interpolate_h for arrays (or scalars) of Q, b, m_bank, S and the roughness
+    # (n_m, k_st or D_90 as in calc_discharge2); all arguments are broadcast against each other
+    # and only the elements that did not converge yet (|Q - Qk| / Q > tolerance) are updated
+    # returns the normal depth h, the relative discharge residual and the number of iterations per element
+    # (NaN for elements without solution, e.g., Q <= 0, S <= 0 or b = m_bank = 0)
+    Q, b, m_bank, S, k_st = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in
+                                                 (Q, b, m_bank, S, get_strickler(**kwargs))])
+    n_m = 1 / k_st
+    sqrt_S = np.sqrt(np.where(S > 0, S, np.nan))
+    dP_dh = 2 * np.sqrt(m_bank ** 2 + 1)
+    if h0 is None:
+        # wide channel estimate with the width at 1 m depth
+        with np.errstate(divide="ignore", invalid="ignore"):
+            h = (n_m * Q / ((b + m_bank) * sqrt_S)) ** (3 / 5)
+        h = np.where(np.isfinite(h) & (h > 0), h, 1.0)
+    else:
+        h = np.broadcast_to(np.asarray(h0, dtype=float), Q.shape).copy()
+    valid = (Q > 0) & (S > 0) & (k_st > 0) & (b >= 0) & (m_bank >= 0) & ((b > 0) | (m_bank > 0))
+    h = np.where(valid, h, np.nan)
+    eps = np.full(Q.shape, np.nan)
+    iterations = np.zeros(Q.shape, dtype=int)
+
+    active = np.flatnonzero(valid)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        while True:
+            hk, bk, mk, nk, Qk, sk = (x.flat[active] for x in (h, b, m_bank, n_m, Q, sqrt_S))
+            A = hk * (bk + hk * mk)
+            P = bk + hk * dP_dh.flat[active]
+            eps.flat[active] = np.abs(Qk - A ** (5 / 3) * sk / (nk * P ** (2 / 3))) / Qk
+            keep = (eps.flat[active] > tolerance) & (iterations.flat[active] < max_iterations)
+            active, hk, bk, mk, nk, Qk, sk, A, P = (x[keep] for x in (active, hk, bk, mk, nk, Qk, sk, A, P))
+            if active.size == 0:
+                break
+            dA_dh = bk + 2 * mk * hk
+            F = nk * Qk * P ** (2 / 3) - A ** (5 / 3) * sk
+            dF_dh = 2 / 3 * nk * Qk * P ** (-1 / 3) * dP_dh.flat[active] - 5 / 3 * A ** (2 / 3) * sk * dA_dh
+            h.flat[active] = np.abs(hk - F / dF_dh)
+            iterations.flat[active] += 1
+    if h.ndim == 0:
+        return float(h), float(eps), int(iterations)
+    return h, eps, iterations
+
+
+class RatingTable:
+    def __init__(self, b, m_bank, S, h_min=0.01, h_max=20.0, tolerance=10**-3, max_points=10**5, **kwargs):
+        # stage-discharge table of a trapezoidal channel from calc_discharge2 (roughness: n_m, k_st or D_90)
+        # Q(h) is tabulated on a log-spaced depth grid that is refined (interval bisection) until linear
+        # interpolation of log(Q) over log(h) deviates by less than tolerance / 2 from calc_discharge2 in
+        # the middle of every interval, where the error of a smooth curve is largest
+        # Q(h) rises with h at least linearly (dlogQ/dlogh >= 1), so the relative error of a depth from
+        # get_h is not larger than the relative discharge error (tolerance)
+        self.b = float(b)
+        self.m_bank = float(m_bank)
+        self.S = float(S)
+        self.k_st = float(get_strickler(**kwargs))
+        self.tolerance = tolerance
+        self.h, self.Q, self.error = self.build(h_min, h_max, max_points)
+
+    def discharge(self, h):
+        return calc_discharge2(self.b, h, self.m_bank, self.S, k_st=self.k_st)
+
+    def build(self, h_min, h_max, max_points):
+        log_h = np.linspace(np.log(h_min), np.log(h_max), 17)
+        while True:
+            log_Q = np.log(self.discharge(np.exp(log_h)))
+            log_h_mid = (log_h[:-1] + log_h[1:]) / 2
+            error = np.abs(np.expm1((log_Q[:-1] + log_Q[1:]) / 2 - np.log(self.discharge(np.exp(log_h_mid)))))
+            refine = error > self.tolerance / 2
+            if not refine.any():
+                break
+            if log_h.size + np.count_nonzero(refine) > max_points:
+                raise ValueError("The rating table needs more than %i points for a tolerance of %s." % (
+                    max_points, str(self.tolerance)))
+            log_h = np.sort(np.concatenate([log_h, log_h_mid[refine]]))
+        return np.exp(log_h), np.exp(log_Q), error
+
+    def get_Q(self, h):
+        # discharge for depths h (calc_discharge2 outside of the table range)
+        h = np.asarray(h, dtype=float)
+        inside = (h >= self.h[0]) & (h <= self.h[-1])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            Q = np.where(inside, np.exp(np.interp(np.log(h), np.log(self.h), np.log(self.Q))),
+                         self.discharge(np.where(h > 0, h, np.nan)))
+        return float(Q) if Q.ndim == 0 else Q
+
+    def get_h(self, Q):
+        # normal depth for discharges Q (Newton solution with solve_normal_depth outside of the table range)
+        Q = np.asarray(Q, dtype=float)
+        inside = (Q >= self.Q[0]) & (Q <= self.Q[-1])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            h = np.exp(np.interp(np.log(Q), np.log(self.Q), np.log(self.h)))
+        if not inside.all():
+            h = np.where(inside, h, solve_normal_depth(Q, self.b, self.m_bank, self.S, k_st=self.k_st,
+                                                       tolerance=self.tolerance)[0])
+        return float(h) if h.ndim == 0 else h
+
+
+@functools.lru_cache(maxsize=128)
+def cached_rating_table(b, m_bank, S, k_st, h_min, h_max, tolerance):
+    return RatingTable(b, m_bank, S, h_min=h_min, h_max=h_max, tolerance=tolerance, k_st=k_st)
+
+
+def get_rating_table(b, m_bank, S, h_min=0.01, h_max=20.0, tolerance=10**-3, **kwargs):
+    # RatingTable from an LRU cache of the last 128 channels (key: geometry, slope, roughness, range and
+    # tolerance); the roughness is converted to k_st, so that n_m=0.05 and k_st=20 share one table
+    k_st = float(get_strickler(**kwargs))
+    return cached_rating_table(float(b), float(m_bank), float(S), k_st, float(h_min), float(h_max), float(tolerance))
+
+
 if __name__ == '__main__':
     # input parameters
     Q = 15.5        # discharge in (m3/s)
@@ -51,9 +178,11 @@ if __name__ == '__main__':
     n_m = 1 / k_st  # Manning's n
     S_0 = 0.005     # channel slope
 
-print(calc_discharge(b, 2.0, k_st, m_bank, S_0))
-print(calc_discharge2(b, 2.0, m_bank, S_0,k_st=20))
-print(interpolate_h(Q, b, m_bank, S_0))
+    print(calc_discharge(b, 2.0, k_st, m_bank, S_0))
+    print(calc_discharge2(b, 2.0, m_bank, S_0,k_st=20))
+    print(interpolate_h(Q, b, m_bank, S_0))
+    print(solve_normal_depth(Q, b, m_bank, S_0, k_st=k_st))
+    print(get_rating_table(b, m_bank, S_0, n_m=n_m).get_h(Q))
 
     # call the solver with user-defined channel geometry and discharge
     #h_n = interpolate_h(Q, b, n_m=n_m, m_bank=m_bank, S0=S_0)
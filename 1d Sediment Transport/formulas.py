@@ -0,0 +1,35 @@
+from mpm import *
+
+
+@register_formula("Parker")
+def parker_kernel(bed, tau_xcr=0.03):
+    # Parker (1979) gravel bed load fit: phi = 11.2 * tau_x^1.5 * (1 - tau_xcr / tau_x)^4.5
+    transport = bed.tau_x > tau_xcr
+    tau_x = np.where(transport, bed.tau_x, 1.0)
+    return np.where(transport, 11.2 * tau_x ** (3 / 2) * (1 - tau_xcr / tau_x) ** 4.5, 0.0)
+
+
+@register_formula("Wilcock-Crowe")
+def wilcock_crowe_kernel(bed, sand_fraction=0.0):
+    # Wilcock and Crowe (2003) applied to the characteristic grain size (D_i = D_sm)
+    # reference Shields stress as a function of the surface sand fraction
+    tau_xr = 0.021 + 0.015 * np.exp(-20 * sand_fraction)
+    with np.errstate(invalid="ignore"):
+        # NaN tau_x yields ratio = 0 and phi = 0.0 like the MPM kernel
+        ratio = np.where(bed.tau_x > 0, bed.tau_x / tau_xr, 0.0)
+        W_x = np.where(ratio < 1.35,
+                       0.002 * ratio ** 7.5,
+                       14 * (1 - 0.894 / np.sqrt(np.maximum(ratio, 1.35))) ** 4.5)
+        # W* = (s - 1) * g * qb / u*^3 converts to phi = W* * tau_x^1.5
+        return W_x * np.where(bed.tau_x > 0, bed.tau_x, 0.0) ** (3 / 2)
+
+
+@register_formula("Smart-Jaeggi")
+def smart_jaeggi_kernel(bed, tau_xcr=0.05, D90_D30=1.0):
+    # Smart and Jaeggi (1983) for steep channels:
+    # phi = 4 * (D90/D30)^0.2 * Se^0.6 * c * tau_x^0.5 * (tau_x - tau_xcr), with c = u / u*
+    transport = bed.tau_x > tau_xcr
+    with np.errstate(divide="ignore", invalid="ignore"):
+        c = bed.u / np.sqrt(bed.g * bed.Rh * bed.Se)
+        phi = 4 * D90_D30 ** 0.2 * bed.Se ** 0.6 * c * np.sqrt(bed.tau_x) * (bed.tau_x - tau_xcr)
+    return np.where(transport, phi, 0.0)
@@ -1,75 +1,79 @@
 import os
-import pandas as pd
 from grains import GrainReader
 from hec import *
 from mpm import *
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill
-import matplotlib.pyplot as plt
+from formulas import *
+from writer import *
 
 def get_char_grain_size(file_name=str, D_char=str):
     grain_info = GrainReader(file_name)
     return grain_info.size_classes["size"][D_char]
 
 
-def add_header_background_color(file_path, sheet_name="Sheet1"):
-    try:
-        # Open the Excel workbook
-        wb = load_workbook(file_path)
-        sheet = wb[sheet_name]
-
-        # Define a fill for the background color (e.g., light blue)
-        header_fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
-
-        # Apply the fill to the header row (assumes headers are in the first row)
-        for cell in sheet[1]:
-            cell.fill = header_fill
-
-        # Save the workbook
-        wb.save(file_path)
-        wb.close()
-    except Exception as e:
-        print(f"Failed to apply background color: {e}")
-
-
-def calculate_mpm(hec_df, D_char):
-    # create dictionary with relevant information about bed load transport with void lists
+def validity_report(section_mpm, hec_df):
+    # one row per profile that violates at least one MPM validity rule with one True/False column per rule
+    report = pd.DataFrame(section_mpm.validity)
+    report.insert(0, "River Sta", hec_df["River Sta"].to_numpy())
+    report.insert(1, "Scenario", hec_df["Profile"].to_numpy())
+    return report[report[list(section_mpm.validity.keys())].any(axis=1)].reset_index(drop=True)
+
+
+def calculate_mpm(hec_df, D_char, formulas=None, report_file=None, verbose=False):
+    # formulas is an optional list of registered bed load formulas (see BED_LOAD_FORMULAS) given as
+    # names or (name, params) tuples, e.g. ["MPM", ("Smart-Jaeggi", {"D90_D30": 2.0})];
+    # all formulas are evaluated on the same hydraulic arrays in one pass
+    # report_file is an optional csv file for the validity_report; verbose=True logs every profile
+    # skip rows without river station (e.g., HEC-RAS unit rows)
+    hec_df = hec_df[np.char.lower(hec_df["River Sta"].to_numpy().astype(str)) != "nan"]
+    logging.info("PROCESSING {0} PROFILES".format(str(hec_df.shape[0])))
+
+    # extract relevant hydraulic data from HEC-RAS output file as arrays
+    h = hec_df["Hydr Depth"].to_numpy(dtype=float)
+    Q = hec_df["Q Total"].to_numpy(dtype=float)
+    section_mpm = MPMArray(grain_size=D_char,
+                           Froude=hec_df["Froude # Chl"].to_numpy(dtype=float),
+                           water_depth=h,
+                           velocity=hec_df["Vel Chnl"].to_numpy(dtype=float),
+                           Q=Q,
+                           hydraulic_radius=hec_df["Hydr Radius"].to_numpy(dtype=float),
+                           slope=hec_df["E.G. Slope"].to_numpy(dtype=float))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        b = hec_df["Flow Area"].to_numpy(dtype=float) / h
+
+    # validity diagnostics (one summary for all rows instead of one warning per row)
+    report = validity_report(section_mpm, hec_df)
+    logging.info("VALIDITY RANGE VIOLATIONS: {0} of {1} PROFILES ({2})".format(
+        str(report.shape[0]), str(hec_df.shape[0]),
+        ", ".join("%s: %i" % (name, np.count_nonzero(mask)) for name, mask in section_mpm.validity.items())))
+    if report_file:
+        report.to_csv(report_file, index=False)
+    if verbose:
+        for sta, scenario in zip(hec_df["River Sta"], hec_df["Profile"]):
+            logging.info("PROCESSING PROFILE {0} FOR SCENARIO {1}".format(str(sta), str(scenario)))
+        for row in report.itertuples(index=False):
+            logging.warning("Profile {0} ({1}) out of validity range: {2}".format(
+                str(row[0]), str(row[1]), ", ".join(name for name, invalid in zip(report.columns[2:], row[2:]) if invalid)))
+
+    # create dictionary with relevant information about bed load transport
     mpm_dict = {
-            "River Sta": [],
-            "Scenario": [],
-            "Q (m3/s)": [],
-            "Phi (-)": [],
-            "Qb (kg/s)": []
+            "River Sta": hec_df["River Sta"].to_numpy(),
+            "Scenario": hec_df["Profile"].to_numpy(),
+            "Q (m3/s)": Q
     }
-
-    # extract relevant hydraulic data from HEC-RAS output file
-    Froude = hec_df["Froude # Chl"]
-    h = hec_df["Hydr Depth"]
-    Q = hec_df["Q Total"]
-    Rh = hec_df["Hydr Radius"]
-    Se = hec_df["E.G. Slope"]
-    u = hec_df["Vel Chnl"]
-
-    for i, sta in enumerate(list(hec_df["River Sta"])):
-        if not str(sta).lower() == "nan":
-            logging.info("PROCESSING PROFILE {0} FOR SCENARIO {1}".format(str(hec_df["River Sta"][i]), str(hec_df["Profile"][i])))
-            mpm_dict["River Sta"].append(hec_df["River Sta"][i])
-            mpm_dict["Scenario"].append(hec_df["Profile"][i])
-            section_mpm = MPM(grain_size=D_char,
-                              Froude=Froude[i],
-                              water_depth=h[i],
-                              velocity=u[i],
-                              Q=Q[i],
-                              hydraulic_radius=Rh[i],
-                              slope=Se[i])
-            mpm_dict["Q (m3/s)"].append(Q[i])
-            mpm_dict["Phi (-)"].append(section_mpm.phi)
-            b = hec_df["Flow Area"][i] / h[i]
-            mpm_dict["Qb (kg/s)"].append(section_mpm.add_dimensions(b))
+    if formulas is None:
+        mpm_dict["Phi (-)"] = section_mpm.phi
+        mpm_dict["Qb (kg/s)"] = section_mpm.add_dimensions(b)
+    else:
+        for formula in formulas:
+            name, params = (formula, {}) if isinstance(formula, str) else formula
+            phi = section_mpm.evaluate(name, **params)
+            mpm_dict["Phi {0} (-)".format(name)] = phi
+            mpm_dict["Qb {0} (kg/s)".format(name)] = section_mpm.add_dimensions(b, phi)
     return pd.DataFrame(mpm_dict)
 
 
 def plot_bedload_transport(mpm_results):
+    import matplotlib.pyplot as plt
     # Extract unique river stations
     river_stations = mpm_results["River Sta"].unique()
 
@@ -101,23 +105,26 @@ def plot_bedload_transport(mpm_results):
         plt.show()
 
 
-@log_actions
-def main():
+@log_actions(instrument=True)
+def main(out_format="xlsx"):
     # Get characteristic grain size = D84
-    D_char = get_char_grain_size(file_name=os.path.abspath("../..") + "\\grains.csv",
-                                 D_char="D84")
+    with stage("grain lookup"):
+        D_char = get_char_grain_size(file_name=os.path.abspath("../..") + "\\grains.csv",
+                                     D_char="D84")
     hec_file = os.path.abspath("..") + "{0}HEC-RAS{0}output.xlsx".format(os.sep)
-    hec = HecSet(hec_file)
+    with stage("workbook load"):
+        hec = HecSet(hec_file)
     logging.info(hec.hec_data.head())
 
-    mpm_results = calculate_mpm(hec.hec_data, D_char)
-    mpm_results.to_excel(os.path.abspath("..") + os.sep + "bed_load_mpm.xlsx")
-
-    # Add background color to headers
-    add_header_background_color((os.path.abspath("..") + os.sep + "bed_load_mpm.xlsx"))
+    with stage("MPM compute"):
+        mpm_results = calculate_mpm(hec.hec_data, D_char)
+    # write results with colored headers (xlsx) or as csv, parquet or npz
+    with stage("result write"):
+        write_results(mpm_results, os.path.abspath("..") + os.sep + "bed_load_mpm." + out_format.strip("."))
 
     # Select and plot 3 profiles
-    plot_bedload_transport(mpm_results)
+    with stage("plotting"):
+        plot_bedload_transport(mpm_results)
 
 if __name__ == '__main__':
     main()
@@ -43,4 +43,47 @@ class MPM(BedCore):
                 self.phi = 0.0
         except TypeError:
             logging.warning("Could not calculate PHI (result=%s)." % str(tau_x))
-            self.phi = np.nan
\ No newline at end of file
+            self.phi = np.nan
+
+
+@register_formula("MPM")
+def mpm_kernel(bed, tau_xcr=None):
+    # tau_xcr defaults to the critical Shields parameter of bed (BedCore.tau_xcr)
+    if tau_xcr is None:
+        tau_xcr = bed.tau_xcr
+    argument = 0.85 * bed.tau_x - tau_xcr
+    # tau_x <= tau_xcr, negative arguments and NaN tau_x all yield phi=0.0 like MPM.compute_phi
+    transport = (bed.tau_x > tau_xcr) & (argument >= 0)
+    if np.any((bed.tau_x > tau_xcr) & (argument < 0)):
+        logging.warning("Invalid argument for phi calculation: argument < 0")
+    return np.where(transport, 8 * np.where(transport, argument, 0.0) ** (3 / 2), 0.0)
+
+
+class MPMArray(BedArray):
+    def __init__(self, grain_size, Froude, water_depth,
+                 velocity, Q, hydraulic_radius, slope):
+        # array version of MPM: every hydraulic argument is a 1d sequence
+        # (e.g., HecSet.hec_data columns) and all rows are computed in one pass
+        BedArray.__init__(self, grain_size, Froude, water_depth,
+                          velocity, Q, hydraulic_radius, slope)
+        self.check_validity(self.Fr)
+        self.phi = self.evaluate("MPM")
+
+    def check_validity(self, Fr):
+        # boolean masks (True = out of validity range) per rule for all rows;
+        # NaN entries never count as invalid, same as the scalar comparisons in MPM
+        uh = self.u * self.h
+        shape = np.broadcast(self.Se, self.D, uh, Fr).shape
+        rules = {
+            "Slope": (self.Se < 0.0004) | (self.Se > 0.02),
+            "Grain size": (self.D < 0.0004) | (self.D > 0.0286),
+            "Discharge": (uh < 0.002) | (uh > 2.0),
+            "Relative grain density (s)": (np.asarray(self.s) < 0.25) | (np.asarray(self.s) > 3.2),
+            "Froude number": (Fr < 0.0001) | (Fr > 639),
+        }
+        self.validity = {name: np.broadcast_to(invalid, shape) for name, invalid in rules.items()}
+        for name, invalid in self.validity.items():
+            if np.any(invalid):
+                # rows are profiles (axis 0), further axes such as grain classes count once per row
+                n_rows = np.count_nonzero(np.any(invalid, axis=tuple(range(1, invalid.ndim))))
+                logging.warning("Warning: %s out of validity range (%i rows)." % (name, n_rows))
\ No newline at end of file
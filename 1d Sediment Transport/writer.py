@@ -0,0 +1,124 @@
+import os
+import numpy as np
+from fun import *
+
+pd = lazy_import("pandas")  # loaded at first use (openpyxl is imported by the xlsx functions)
+
+# output format is selected by the file extension
+RESULT_FORMATS = [".xlsx", ".csv", ".parquet", ".npz"]
+
+
+def get_header_fill(color="FF0000"):
+    from openpyxl.styles import PatternFill
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+
+def get_format(out_file):
+    out_format = os.path.splitext(str(out_file))[1].lower()
+    if out_format not in RESULT_FORMATS:
+        raise ValueError("Unsupported result file format %s (use %s)." % (out_format, ", ".join(RESULT_FORMATS)))
+    return out_format
+
+
+def get_temp_file(out_file):
+    # hidden file with the same extension in the folder of out_file (replaces out_file when complete)
+    return os.path.join(os.path.dirname(os.path.abspath(out_file)), ".~" + os.path.basename(out_file))
+
+
+def write_results(results_df, out_file, sheet_name="Sheet1", header_color="FF0000"):
+    # the results are written to a temporary file first so that a failed or interrupted write
+    # never replaces a previous out_file with an incomplete one
+    out_format = get_format(out_file)
+    temp_file = get_temp_file(out_file)
+    try:
+        write_format(results_df, temp_file, out_format, sheet_name, header_color)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    os.replace(temp_file, out_file)
+    return out_file
+
+
+def write_format(results_df, out_file, out_format, sheet_name="Sheet1", header_color="FF0000"):
+    if out_format == ".xlsx":
+        # style the header row while the workbook is still in memory, so it is serialized only once;
+        # MultiIndex levels (e.g., calculate_mpm_fractional) are written as plain columns because
+        # merged index cells make openpyxl slow down sharply with the number of rows
+        with stage("excel write"), pd.ExcelWriter(out_file, engine="openpyxl") as writer:
+            results_df.to_excel(writer, sheet_name=sheet_name, merge_cells=False)
+            with stage("header styling"):
+                header_fill = get_header_fill(header_color)
+                for cell in writer.sheets[sheet_name][1]:
+                    cell.fill = header_fill
+    elif out_format == ".csv":
+        results_df.to_csv(out_file)
+    elif out_format == ".parquet":
+        # requires pyarrow or fastparquet
+        results_df.to_parquet(out_file)
+    else:
+        # npz: column names in "columns" and one array per column named c0, c1, ...
+        # (column names such as "Q (m3/s)" are not valid archive member names)
+        flat_df = results_df.reset_index()
+        arrays = {}
+        for i, column in enumerate(flat_df.columns):
+            if pd.api.types.is_numeric_dtype(flat_df[column]):
+                arrays["c%i" % i] = flat_df[column].to_numpy()
+            else:
+                arrays["c%i" % i] = flat_df[column].astype(str).to_numpy(dtype=str)
+        np.savez(out_file, columns=np.array(flat_df.columns, dtype=str), **arrays)
+
+
+class StreamWriter:
+    def __init__(self, out_file, sheet_name="Sheet1", header_color="FF0000", index=True):
+        # append result chunks to a csv or write-only xlsx file with constant memory; chunks go to a
+        # temporary file in the same folder that replaces out_file only when close() is called, so that
+        # discard() (e.g., after cancelling) never leaves a truncated out_file behind
+        self.out_file = out_file
+        self.out_format = get_format(out_file)
+        if self.out_format not in [".xlsx", ".csv"]:
+            raise ValueError("Streaming output requires a csv or xlsx file (got %s)." % self.out_format)
+        self.temp_file = get_temp_file(out_file)
+        self.header_fill = get_header_fill(header_color)
+        self.index = index
+        self.n_rows = 0
+        self.header_written = False
+        self.wb = None
+        if self.out_format == ".xlsx":
+            from openpyxl import Workbook
+            self.wb = Workbook(write_only=True)
+            self.ws = self.wb.create_sheet(sheet_name)
+
+    def append(self, chunk_df):
+        if self.wb is None:
+            chunk_df.to_csv(self.temp_file, mode="a" if self.header_written else "w", header=not self.header_written,
+                            index=self.index)
+        else:
+            if not self.header_written:
+                from openpyxl.cell import WriteOnlyCell
+                header = []
+                for name in [None] * self.index + list(chunk_df.columns):
+                    cell = WriteOnlyCell(self.ws, value=name)
+                    cell.fill = self.header_fill
+                    header.append(cell)
+                self.ws.append(header)
+            for row in chunk_df.itertuples(index=self.index, name=None):
+                # empty cells for NaN like DataFrame.to_excel
+                self.ws.append([None if pd.isna(value) else value for value in row])
+        self.header_written = True
+        self.n_rows += chunk_df.shape[0]
+
+    def close(self):
+        # without any appended chunk (e.g., a workbook without data rows), out_file is an empty file
+        if self.wb is not None:
+            self.wb.save(self.temp_file)
+            self.wb = None
+        elif not self.header_written:
+            open(self.temp_file, mode="w").close()
+        os.replace(self.temp_file, self.out_file)
+
+    def discard(self):
+        # remove the incomplete output and keep a previous out_file
+        self.wb = None
+        if os.path.exists(self.temp_file):
+            os.remove(self.temp_file)
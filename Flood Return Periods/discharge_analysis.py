@@ -1,45 +1,158 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 
-from plot_discharge import plot_discharge
+# binary cache of a daily flow series: int32 days since EPOCH and float32 discharges (m3/s)
+EPOCH = np.datetime64("1970-01-01", "D")
+FLOW_DTYPE = np.dtype([("day", "<i4"), ("Q", "<f4")])
 
 
+def read_daily_flows(csv_file="flow-data/daily-flow-series.csv"):
+    # load data
+    return pd.read_csv(csv_file,
+                       header=36,
+                       sep=";",
+                       names=["Date", "Q (CMS)"],
+                       usecols=[0, 2],
+                       parse_dates=[0],
+                       index_col="Date")
 
-# load data
-df = pd.read_csv("flow-data/daily-flow-series.csv",
-                 header=36,
-                 sep=";",
-                 names=["Date", "Q (CMS)"],
-                 usecols=[0, 2],
-                 parse_dates=[0],
-                 index_col="Date")
-print(df.head())
 
-# Plot the daily flow data over time
-plot_discharge(df.index,df["Q (CMS)"], title="Daily Flow Data")
+def get_cache_file(csv_file):
+    # cache next to the gauge file (e.g., daily-flow-series.csv.flows.npy)
+    return str(csv_file) + ".flows.npy"
 
-# Resample data to get annual maximum flow values
-annual_max_df = df.resample(rule="YE", kind="period").max()
-annual_max_df["year"] = annual_max_df.index.year
-annual_max_df.reset_index(inplace=True, drop=True)
-print(annual_max_df.head())
-plot_discharge(annual_max_df["year"], annual_max_df["Q (CMS)"], title="Wasserburg a. Inn 1826 - 2016 (annual)")
 
-# Sort data by flow values
-annual_max_df_sorted = annual_max_df.sort_values(by="Q (CMS)")
+def write_flow_cache(csv_file):
+    # parse a gauge file once and store it as a memory-mappable .npy array of FLOW_DTYPE records
+    df = read_daily_flows(csv_file)
+    cache_file = get_cache_file(csv_file)
+    temp_file = cache_file + ".tmp.npy"  # written completely before it replaces an older cache
+    flows = np.lib.format.open_memmap(temp_file, mode="w+", dtype=FLOW_DTYPE, shape=(df.shape[0],))
+    flows["day"] = (df.index.to_numpy().astype("datetime64[D]") - EPOCH).astype(np.int32)
+    flows["Q"] = df["Q (CMS)"].to_numpy(dtype=np.float32)
+    flows.flush()
+    del flows
+    os.replace(temp_file, cache_file)
+    return cache_file
 
-# Find total number of entries and assign a rank to each one
-n = annual_max_df_sorted.shape[0]
-annual_max_df_sorted.insert(0, "rank", range(1, 1 + n))
 
-# Calculate probability of exceedance
-annual_max_df_sorted["pr"] = (n - annual_max_df_sorted["rank"] + 1) / (n + 1)
+def is_cached(csv_file):
+    cache_file = get_cache_file(csv_file)
+    return os.path.isfile(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(csv_file)
 
-# Calculate return period
-annual_max_df_sorted["return-period"] = 1 / annual_max_df_sorted["pr"]
 
-print(annual_max_df_sorted.tail())
+def load_daily_flows(csv_file, refresh=False):
+    # memory-mapped FLOW_DTYPE records of a gauge file; the csv file is only parsed if the cache is
+    # missing, older than the csv file or refresh=True
+    if refresh or not is_cached(csv_file):
+        write_flow_cache(csv_file)
+    return np.load(get_cache_file(csv_file), mmap_mode="r")
 
-from plot_result import plot_q_freq, plot_q_return_period
 
-plot_q_freq(annual_max_df_sorted)
-plot_q_return_period(annual_max_df_sorted)
+def get_gauge_names(csv_files):
+    # unique gauge name per file: file name without extension, or parent folder + file name if several
+    # gauges use the same file name (e.g., <gauge>/daily-flow-series.csv)
+    stems = [os.path.splitext(os.path.basename(csv_file))[0] for csv_file in csv_files]
+    names = []
+    for csv_file, stem in zip(csv_files, stems):
+        if stems.count(stem) > 1:
+            stem = os.path.basename(os.path.dirname(os.path.abspath(csv_file))) + "_" + stem
+        while stem in names:
+            stem += "_"
+        names.append(stem)
+    return names
+
+
+def load_gauges(csv_files, refresh=False, workers=None):
+    # {gauge name (see get_gauge_names): memory-mapped FLOW_DTYPE records} for many gauge files;
+    # files without valid cache are parsed in parallel by a pool of worker processes
+    csv_files = list(csv_files)
+    stale = [csv_file for csv_file in csv_files if refresh or not is_cached(csv_file)]
+    if len(stale) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(write_flow_cache, stale))
+    else:
+        for csv_file in stale:
+            write_flow_cache(csv_file)
+    return {name: np.load(get_cache_file(csv_file), mmap_mode="r")
+            for name, csv_file in zip(get_gauge_names(csv_files), csv_files)}
+
+
+def flows_to_frame(flows):
+    # data frame like read_daily_flows from cached FLOW_DTYPE records
+    return pd.DataFrame({"Q (CMS)": np.asarray(flows["Q"], dtype=float)},
+                        index=pd.DatetimeIndex(EPOCH + flows["day"].astype("timedelta64[D]"), name="Date"))
+
+
+def get_annual_max_array(flows):
+    # annual maximum flows from cached FLOW_DTYPE records (same columns as get_annual_max; years
+    # without records are skipped and NaN flows are ignored)
+    flows = flows[np.argsort(flows["day"], kind="stable")] if np.any(np.diff(flows["day"]) < 0) else flows
+    years = (EPOCH + flows["day"].astype("timedelta64[D]")).astype("datetime64[Y]").astype(int) + 1970
+    year_values, starts = np.unique(years, return_index=True)
+    with np.errstate(invalid="ignore"):
+        annual_max = np.fmax.reduceat(np.asarray(flows["Q"], dtype=float), starts) if starts.size else np.array([])
+    return pd.DataFrame({"Q (CMS)": annual_max, "year": year_values})
+
+
+def get_annual_max(df):
+    # Resample data to get annual maximum flow values
+    annual_max_df = df.resample(rule="YE").max()
+    annual_max_df["year"] = annual_max_df.index.year
+    annual_max_df.reset_index(inplace=True, drop=True)
+    return annual_max_df
+
+
+def rank_annual_max(annual_max_df):
+    # Sort data by flow values
+    annual_max_df_sorted = annual_max_df.sort_values(by="Q (CMS)")
+
+    # Find total number of entries and assign a rank to each one
+    n = annual_max_df_sorted.shape[0]
+    annual_max_df_sorted.insert(0, "rank", range(1, 1 + n))
+
+    # Calculate probability of exceedance
+    annual_max_df_sorted["pr"] = (n - annual_max_df_sorted["rank"] + 1) / (n + 1)
+
+    # Calculate return period
+    annual_max_df_sorted["return-period"] = 1 / annual_max_df_sorted["pr"]
+    return annual_max_df_sorted
+
+
+if __name__ == "__main__":
+    from plot_discharge import plot_discharge
+    from plot_result import plot_q_freq, plot_q_return_period
+
+    # the csv file is parsed only once and then loaded from daily-flow-series.csv.flows.npy
+    flows = load_daily_flows("flow-data/daily-flow-series.csv")
+    df = flows_to_frame(flows)
+    print(df.head())
+
+    # Plot the daily flow data over time
+    plot_discharge(df.index,df["Q (CMS)"], title="Daily Flow Data")
+
+    annual_max_df = get_annual_max_array(flows)
+    print(annual_max_df.head())
+    plot_discharge(annual_max_df["year"], annual_max_df["Q (CMS)"], title="Wasserburg a. Inn 1826 - 2016 (annual)")
+
+    annual_max_df_sorted = rank_annual_max(annual_max_df)
+    print(annual_max_df_sorted.tail())
+
+    plot_q_freq(annual_max_df_sorted)
+    plot_q_return_period(annual_max_df_sorted)
+
+    # design floods beyond the record length (L-moment fits of Gumbel, GEV, Pearson III and Log-Pearson III)
+    from frequency import flood_frequency, bootstrap_frequency
+    print(flood_frequency({"Wasserburg a. Inn": annual_max_df}, return_periods=(100, 300, 1000)))
+    # 90 % bootstrap confidence bands
+    print(bootstrap_frequency({"Wasserburg a. Inn": annual_max_df}, return_periods=(100, 300, 1000), seed=0))
+
+    # partial-duration series (about 3 independent events per year) and Generalized Pareto design floods
+    from peaks import pot_frequency
+    print(pot_frequency({"Wasserburg a. Inn": flows}, return_periods=(100, 300, 1000)))
+
+    # low flows for environmental flow reporting (Q347, mean annual n-day minima, 7Q10 ...)
+    from low_flow import low_flow_statistics
+    print(low_flow_statistics({"Wasserburg a. Inn": flows}, windows=(1, 7, 30)).T)
@@ -0,0 +1,214 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+# fitted distributions; parameters are arrays (one value per gauge) of loc, scale and shape:
+# gumbel: shape = 0, gev: shape = k (Hosking; k > 0 has an upper bound, scipy's genextreme c),
+# pe3: shape = skewness, lp3: pe3 of log10(Q)
+DISTRIBUTIONS = ["gumbel", "gev", "pe3", "lp3"]
+EULER = 0.5772156649015329
+
+
+def get_sample_matrix(series):
+    # gauges x years matrix (NaN padded) and gauge names from a dict or list of annual maximum series
+    # (annual_max_df data frames with a "Q (CMS)" column or 1d arrays)
+    if not isinstance(series, dict):
+        series = {i: values for i, values in enumerate(series)}
+    arrays = [np.asarray(values["Q (CMS)"] if isinstance(values, pd.DataFrame) else values, dtype=float)
+              for values in series.values()]
+    samples = np.full((len(arrays), max([a.size for a in arrays], default=0)), np.nan)
+    for i, values in enumerate(arrays):
+        samples[i, :values.size] = values
+    return samples, list(series.keys())
+
+
+def calc_lmoments(samples):
+    # sample L-moments l1, l2, t3 = l3 / l2 and t4 = l4 / l2 for every row of a gauges x years matrix
+    # (NaN = missing) from the probability weighted moments b0..b3 of the sorted samples; the rank
+    # weights only depend on the sample size n, so b0..b3 are one matrix product per distinct n
+    samples = np.atleast_2d(np.asarray(samples, dtype=float))
+    x = np.sort(samples, axis=1)  # NaN at the end
+    counts = np.count_nonzero(~np.isnan(x), axis=1)
+    x = np.where(np.isnan(x), 0.0, x)
+    j = np.arange(x.shape[1], dtype=float)  # 0-based rank
+    b = np.full((x.shape[0], 4), np.nan)
+    for n in np.unique(counts[counts >= 4]):
+        weights = np.ones((x.shape[1], 4))
+        for r in range(1, 4):
+            weights[:, r] = weights[:, r - 1] * (j - r + 1) / (n - r)
+        weights[int(n):] = 0.0
+        rows = counts == n
+        b[rows] = x[rows] @ weights / n
+    with np.errstate(divide="ignore", invalid="ignore"):
+        l2 = 2 * b[:, 1] - b[:, 0]
+        l3 = 6 * b[:, 2] - 6 * b[:, 1] + b[:, 0]
+        l4 = 20 * b[:, 3] - 30 * b[:, 2] + 12 * b[:, 1] - b[:, 0]
+        return np.column_stack([b[:, 0], l2, l3 / l2, l4 / l2])
+
+
+def fit_pe3_lmoments(l1, l2, t3):
+    # Pearson type III from L-moments with the rational approximations of Hosking and Wallis (1997)
+    from scipy.special import gammaln
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tm = np.where(np.abs(t3) >= 1 / 3, 1 - np.abs(t3), 3 * np.pi * t3 ** 2)
+        alpha = np.where(np.abs(t3) >= 1 / 3,
+                         tm * (0.36067 + tm * (-0.59567 + tm * 0.25361)) /
+                         (1 + tm * (-2.78861 + tm * (2.56096 - tm * 0.77045))),
+                         (1 + 0.2906 * tm) / (tm * (1 + tm * (0.1882 + 0.0442 * tm))))
+        skew = np.where(t3 == 0, 0.0, 2 * np.sign(t3) / np.sqrt(alpha))
+        # sigma = l2 * sqrt(pi * alpha) * Gamma(alpha) / Gamma(alpha + 0.5) (normal distribution for alpha -> inf)
+        ratio = np.exp(gammaln(alpha) - gammaln(alpha + 0.5))
+        scale = np.where(t3 == 0, l2 * np.sqrt(np.pi), l2 * np.sqrt(np.pi * alpha) * ratio)
+    return {"loc": l1, "scale": scale, "shape": skew}
+
+
+def fit_lmoments(samples, distribution="gev"):
+    # L-moment parameters of distribution for every row of a gauges x years matrix
+    if distribution == "lp3":
+        with np.errstate(divide="ignore", invalid="ignore"):
+            samples = np.log10(np.where(np.asarray(samples, dtype=float) > 0, samples, np.nan))
+    return fit_from_lmoments(calc_lmoments(samples), distribution)
+
+
+def fit_from_lmoments(lmoments, distribution="gev"):
+    # parameters from calc_lmoments (of log10(Q) for lp3)
+    l1, l2, t3, t4 = lmoments.T
+    if distribution == "gumbel":
+        scale = l2 / np.log(2)
+        return {"loc": l1 - EULER * scale, "scale": scale, "shape": np.zeros_like(l1)}
+    if distribution == "gev":
+        c = 2 / (3 + t3) - np.log(2) / np.log(3)
+        k = 7.8590 * c + 2.9554 * c ** 2
+        from scipy.special import gamma
+        gamma_k = gamma(1 + k)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scale = np.where(np.abs(k) > 1e-6, l2 * k / ((1 - 2 ** -k) * gamma_k), l2 / np.log(2))
+            loc = np.where(np.abs(k) > 1e-6, l1 - scale * (1 - gamma_k) / k, l1 - EULER * scale)
+        return {"loc": loc, "scale": scale, "shape": k}
+    if distribution in ["pe3", "lp3"]:
+        return fit_pe3_lmoments(l1, l2, t3)
+    raise KeyError("Unknown distribution %s (use one of %s)." % (distribution, ", ".join(DISTRIBUTIONS)))
+
+
+def fit_mle(samples, distribution="gev"):
+    # maximum likelihood parameters (scipy.stats, one fit per gauge started from the L-moment fit)
+    from scipy import stats
+    samples = np.atleast_2d(np.asarray(samples, dtype=float))
+    start = fit_lmoments(samples, distribution)
+    params = {name: np.full(samples.shape[0], np.nan) for name in ["loc", "scale", "shape"]}
+    for i, row in enumerate(samples):
+        x = row[~np.isnan(row)]
+        if distribution == "lp3":
+            x = np.log10(x[x > 0])
+        if x.size < 4 or not np.isfinite(start["scale"][i]):
+            continue
+        try:
+            if distribution == "gumbel":
+                loc, scale = stats.gumbel_r.fit(x, loc=start["loc"][i], scale=start["scale"][i])
+                shape = 0.0
+            elif distribution == "gev":
+                shape, loc, scale = stats.genextreme.fit(x, start["shape"][i], loc=start["loc"][i],
+                                                         scale=start["scale"][i])
+            elif distribution in ["pe3", "lp3"]:
+                shape, loc, scale = stats.pearson3.fit(x, start["shape"][i], loc=start["loc"][i],
+                                                       scale=start["scale"][i])
+            else:
+                raise KeyError("Unknown distribution %s (use one of %s)." % (distribution, ", ".join(DISTRIBUTIONS)))
+        except (ValueError, RuntimeError, FloatingPointError) as e:
+            logging.warning("MLE fit of %s failed for gauge %i: %s" % (distribution, i, str(e)))
+            continue
+        params["loc"][i], params["scale"][i], params["shape"][i] = loc, scale, shape
+    return params
+
+
+def get_quantiles(params, distribution, return_periods):
+    # gauges x return periods matrix of the discharges with annual exceedance probability 1 / T
+    F = (1 - 1 / np.asarray(return_periods, dtype=float))[np.newaxis, :]
+    loc, scale, shape = (np.asarray(params[name], dtype=float)[:, np.newaxis] for name in ["loc", "scale", "shape"])
+    y = -np.log(-np.log(F))  # Gumbel reduced variate
+    if distribution == "gumbel":
+        return loc + scale * y
+    if distribution == "gev":
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(np.abs(shape) > 1e-6, loc + scale / shape * (1 - (-np.log(F)) ** shape), loc + scale * y)
+    if distribution in ["pe3", "lp3"]:
+        from scipy.stats import pearson3
+        quantiles = pearson3.ppf(F, shape, loc=loc, scale=scale)
+        return 10 ** quantiles if distribution == "lp3" else quantiles
+    raise KeyError("Unknown distribution %s (use one of %s)." % (distribution, ", ".join(DISTRIBUTIONS)))
+
+
+def flood_frequency(series, return_periods=(2, 5, 10, 20, 50, 100, 300, 1000), distributions=None,
+                    method="lmoments"):
+    # design floods (HQ2 ... HQ1000) of many gauges in one call; series: dict or list of annual maximum
+    # series (e.g., {gauge: get_annual_max(df)}); method: "lmoments" or "mle"
+    # returns one row per gauge and distribution with the parameters and one HQ<T> column per return period
+    samples, gauges = get_sample_matrix(series)
+    tables = []
+    for distribution in distributions or DISTRIBUTIONS:
+        if method == "lmoments":
+            params = fit_lmoments(samples, distribution)
+        elif method == "mle":
+            params = fit_mle(samples, distribution)
+        else:
+            raise ValueError("Unknown fitting method %s (use lmoments or mle)." % method)
+        quantiles = get_quantiles(params, distribution, return_periods)
+        table = pd.DataFrame({"Gauge": gauges, "Distribution": distribution,
+                              "n": np.count_nonzero(~np.isnan(samples), axis=1),
+                              "loc": params["loc"], "scale": params["scale"], "shape": params["shape"]})
+        for T, quantile in zip(return_periods, quantiles.T):
+            table["HQ%s" % str(T)] = quantile
+        tables.append(table)
+    return pd.concat(tables, ignore_index=True).set_index(["Gauge", "Distribution"]).sort_index(level=0, sort_remaining=False)
+
+
+def bootstrap_gauge(sample, distributions, return_periods, n_replicates=10000, percentiles=(5, 50, 95),
+                    seed=None, block_size=2500):
+    # percentiles of the L-moment quantiles of n_replicates bootstrap resamples of one annual maximum
+    # series; every block of replicates is one 2-D index array (replicates x years) that is refitted at once
+    # returns an array of shape (distributions, return periods, percentiles)
+    x = np.asarray(sample, dtype=float)
+    x = x[~np.isnan(x)]
+    rng = np.random.default_rng(seed)
+    quantiles = {distribution: [] for distribution in distributions}
+    for start in range(0, n_replicates, block_size):
+        resamples = x[rng.integers(0, x.size, size=(min(block_size, n_replicates - start), x.size))]
+        # the L-moments of a block are shared by all distributions (of log10(Q) for lp3)
+        lmoments = calc_lmoments(resamples) if set(distributions) - {"lp3"} else None
+        if "lp3" in distributions:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                log_lmoments = calc_lmoments(np.log10(np.where(resamples > 0, resamples, np.nan)))
+        for distribution in distributions:
+            params = fit_from_lmoments(log_lmoments if distribution == "lp3" else lmoments, distribution)
+            quantiles[distribution].append(get_quantiles(params, distribution, return_periods))
+    return np.stack([np.nanpercentile(np.concatenate(quantiles[distribution]), percentiles, axis=0).T
+                     for distribution in distributions])
+
+
+def bootstrap_frequency(series, return_periods=(2, 5, 10, 20, 50, 100, 300, 1000), distributions=None,
+                        n_replicates=10000, percentiles=(5, 50, 95), seed=None, workers=None):
+    # bootstrap confidence bands of the design floods of many gauges (one HQ<T> P<percentile> column per
+    # return period and percentile); gauges are processed on a pool of worker processes if workers is
+    # defined and every gauge gets its own random stream of seed (results do not depend on workers)
+    samples, gauges = get_sample_matrix(series)
+    distributions = distributions or DISTRIBUTIONS
+    logging.info("BOOTSTRAP: {0} GAUGES WITH {1} REPLICATES".format(str(len(gauges)), str(n_replicates)))
+    seeds = np.random.SeedSequence(seed).spawn(len(gauges))
+    gauge_args = (list(samples), [distributions] * len(gauges), [return_periods] * len(gauges),
+                  [n_replicates] * len(gauges), [percentiles] * len(gauges), seeds)
+    if workers:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            bands = list(pool.map(bootstrap_gauge, *gauge_args))
+    else:
+        bands = list(map(bootstrap_gauge, *gauge_args))
+
+    rows = []
+    for gauge, gauge_bands in zip(gauges, bands):
+        for distribution, band in zip(distributions, gauge_bands):
+            row = {"Gauge": gauge, "Distribution": distribution}
+            for T, values in zip(return_periods, band):
+                for percentile, value in zip(percentiles, values):
+                    row["HQ{0} P{1}".format(str(T), str(percentile))] = value
+            rows.append(row)
+    return pd.DataFrame(rows).set_index(["Gauge", "Distribution"])
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+from discharge_analysis import EPOCH
+from frequency import fit_lmoments, get_quantiles
+
+
+def get_daily_grid(records):
+    # continuous daily flows from the first to the last day of flow records (load_daily_flows); missing
+    # days are NaN; returns the days since EPOCH and the flows
+    days = np.asarray(records["day"], dtype=np.int64)
+    first = days.min()
+    flows = np.full(days.max() - first + 1, np.nan)
+    flows[days - first] = np.asarray(records["Q"], dtype=float)
+    return np.arange(first, days.max() + 1), flows
+
+
+def partition_quantiles(values, q):
+    # exact linear-interpolation quantiles (like np.quantile) of the non-NaN values from np.partition
+    # at the two order statistics around every quantile instead of a full sort
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    q = np.atleast_1d(np.asarray(q, dtype=float))
+    if values.size == 0:
+        return np.full(q.shape, np.nan)
+    position = q * (values.size - 1)
+    low = np.floor(position).astype(int)
+    high = np.minimum(low + 1, values.size - 1)
+    selected = np.partition(values, np.unique(np.concatenate([low, high])))
+    return selected[low] + (position - low) * (selected[high] - selected[low])
+
+
+def flow_duration_curve(records, exceedance=np.arange(1, 100) / 100):
+    # flows that are reached or exceeded with the given exceedance probabilities (fractions of all days)
+    return partition_quantiles(np.asarray(records["Q"], dtype=float), 1 - np.asarray(exceedance, dtype=float))
+
+
+def get_cumulative_sums(flows):
+    # cumulative sums of the flows (missing = 0) and of the number of missing days with a leading 0
+    missing = np.isnan(flows)
+    return (np.concatenate([[0.0], np.cumsum(np.where(missing, 0.0, flows))]),
+            np.concatenate([[0], np.cumsum(missing)]))
+
+
+def rolling_mean(flows, window, cumulative_sums=None):
+    # n-day moving averages from cumulative sums; element i is the mean of flows[i - window + 1 : i + 1]
+    # (NaN for the first window - 1 days and for windows with missing days); cumulative_sums of
+    # get_cumulative_sums can be reused for several windows
+    total, n_missing = cumulative_sums if cumulative_sums is not None else get_cumulative_sums(flows)
+    means = np.full(flows.size, np.nan)
+    means[window - 1:] = np.where(n_missing[window:] - n_missing[:-window] == 0,
+                                  (total[window:] - total[:-window]) / window, np.nan)
+    return means
+
+
+def get_annual_minima(records, windows=(1, 7, 30), year_start_month=1, max_missing=0.1):
+    # annual minima of n-day mean flows (one column "<n>-day min (CMS)" per window) per year starting in
+    # year_start_month (e.g., 4 for climatic years starting on April 1); a window belongs to the year of its
+    # last day and years with less than (1 - max_missing) * 365 valid window values are NaN
+    days, flows = get_daily_grid(records)
+    months = (EPOCH + days.astype("timedelta64[D]")).astype("datetime64[M]") - np.timedelta64(year_start_month - 1, "M")
+    years = months.astype("datetime64[Y]").astype(int) + 1970
+    year_values, starts = np.unique(years, return_index=True)
+    cumulative_sums = get_cumulative_sums(flows)
+    minima = {}
+    for window in windows:
+        means = rolling_mean(flows, window, cumulative_sums)
+        valid = np.add.reduceat(~np.isnan(means), starts)
+        with np.errstate(invalid="ignore"):
+            annual = np.fmin.reduceat(means, starts)
+        minima["%i-day min (CMS)" % window] = np.where(valid >= (1 - max_missing) * 365, annual, np.nan)
+    return pd.DataFrame(minima, index=pd.Index(year_values, name="year"))
+
+
+def low_flow_statistics(gauges, windows=(1, 7, 30), return_periods=(2, 10), q347=True, year_start_month=1,
+                        max_missing=0.1):
+    # low-flow statistics of many gauges ({gauge: flow records}, e.g., load_gauges) and window lengths:
+    # Q347 (flow reached or exceeded on 347 of 365 days), the mean annual n-day minimum MAM<n> and the
+    # n-day low flow with return period T <n>Q<T> (e.g., 7Q10) from Log-Pearson III L-moment fits of the
+    # annual n-day minima (non-exceedance probability 1 / T)
+    return_periods = np.asarray(return_periods, dtype=float)
+    rows = []
+    gauge_names = list(gauges.keys())
+    minima = [get_annual_minima(gauges[gauge], windows, year_start_month, max_missing) for gauge in gauge_names]
+    for gauge, annual_minima in zip(gauge_names, minima):
+        row = {"Gauge": gauge}
+        if q347:
+            row["Q347 (CMS)"] = flow_duration_curve(gauges[gauge], [347 / 365])[0]
+        rows.append(row)
+    for window in windows:
+        column = "%i-day min (CMS)" % window
+        # one L-moment fit for all gauges (gauges x years matrix); F = 1 / T is the upper-tail quantile of
+        # the return period T / (T - 1)
+        samples = np.full((len(minima), max([m.shape[0] for m in minima], default=0)), np.nan)
+        for i, annual_minima in enumerate(minima):
+            samples[i, :annual_minima.shape[0]] = annual_minima[column].to_numpy()
+        low_flows = get_quantiles(fit_lmoments(samples, "lp3"), "lp3", return_periods / (return_periods - 1))
+        for row, values, gauge_samples in zip(rows, low_flows, samples):
+            row["MAM%i (CMS)" % window] = np.nanmean(gauge_samples) if np.any(~np.isnan(gauge_samples)) else np.nan
+            for T, value in zip(return_periods, values):
+                row["%iQ%s (CMS)" % (window, "%g" % T)] = value
+    return pd.DataFrame(rows).set_index("Gauge")
+
+
+def flow_duration_curves(gauges, exceedance=np.arange(1, 100) / 100):
+    # gauges x exceedance probability table of flow-duration curves
+    return pd.DataFrame([flow_duration_curve(records, exceedance) for records in gauges.values()],
+                        index=pd.Index(list(gauges.keys()), name="Gauge"),
+                        columns=["Q%g" % (100 * p) for p in np.asarray(exceedance, dtype=float)])
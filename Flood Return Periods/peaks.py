@@ -0,0 +1,128 @@
+import logging
+import numpy as np
+import pandas as pd
+from discharge_analysis import EPOCH
+
+
+def get_pot_events(days, flows, threshold, min_separation=7, trough_ratio=0.75):
+    # independent flood events (peaks over threshold) of a daily series (days: int days since EPOCH,
+    # e.g., the "day" field of load_daily_flows, flows: m3/s)
+    # runs of exceedances are found with np.diff and two successive events are merged while their peaks
+    # are less than min_separation days apart or the trough between them is higher than
+    # trough_ratio * the smaller peak (dependent events); returns a dict of arrays per event
+    days = np.asarray(days)
+    flows = np.asarray(flows, dtype=float)
+    above = np.concatenate([[False], np.nan_to_num(flows, nan=-np.inf) > threshold, [False]])
+    starts = np.flatnonzero(~above[:-1] & above[1:])
+    ends = np.flatnonzero(above[:-1] & ~above[1:])  # exclusive
+    if starts.size == 0:
+        empty = np.array([], dtype=int)
+        return {"peak": empty, "start": empty, "end": empty, "day": days[empty], "Q": flows[empty]}
+
+    # peak index per run: the first maximum after sorting by run and descending flow
+    run = np.repeat(np.arange(starts.size), ends - starts)
+    index = np.flatnonzero(above[1:-1])
+    order = np.lexsort((-flows[index], run))
+    first = np.concatenate([[True], run[order][1:] != run[order][:-1]])
+    peaks = index[order][first]
+
+    # merge dependent events until all successive events are independent
+    while peaks.size > 1:
+        troughs = np.fmin.reduceat(flows, peaks)[:-1]  # minimum between successive peaks
+        smaller = np.minimum(flows[peaks[:-1]], flows[peaks[1:]])
+        dependent = (days[peaks[1:]] - days[peaks[:-1]] < min_separation) | (troughs > trough_ratio * smaller)
+        if not dependent.any():
+            break
+        cluster = np.concatenate([[0], np.cumsum(~dependent)])
+        keep = np.concatenate([[True], cluster[1:] != cluster[:-1]])
+        # the largest peak of a cluster is the event peak
+        order = np.lexsort((-flows[peaks], cluster))
+        first = np.concatenate([[True], cluster[order][1:] != cluster[order][:-1]])
+        starts, ends = starts[keep], np.maximum.reduceat(ends, np.flatnonzero(keep))
+        peaks = peaks[order][first]
+    return {"peak": peaks, "start": starts, "end": ends, "day": days[peaks], "Q": flows[peaks]}
+
+
+def get_record_years(days):
+    return (np.max(days) - np.min(days) + 1) / 365.25 if np.size(days) else np.nan
+
+
+def select_threshold(days, flows, events_per_year=3.0, min_separation=7, trough_ratio=0.75, iterations=30):
+    # threshold with (about) events_per_year independent events per year of record by bisection
+    # between the 50 % and the maximum flow quantile
+    flows = np.asarray(flows, dtype=float)
+    years = get_record_years(days)
+    low, high = np.nanquantile(flows, 0.5), np.nanmax(flows)
+    for _ in range(iterations):
+        threshold = (low + high) / 2
+        n_events = get_pot_events(days, flows, threshold, min_separation, trough_ratio)["peak"].size
+        if n_events > events_per_year * years:
+            low = threshold
+        else:
+            high = threshold
+    return high
+
+
+def fit_gpd(excesses, method="lmoments"):
+    # Generalized Pareto distribution of threshold excesses (lower bound 0) with Hosking's shape k
+    # (k > 0: upper bound, k = 0: exponential) and scale alpha from L-moments or maximum likelihood
+    excesses = np.asarray(excesses, dtype=float)
+    excesses = excesses[~np.isnan(excesses)]
+    if excesses.size < 3:
+        return np.nan, np.nan
+    if method == "mle":
+        from scipy.stats import genpareto
+        c, loc, scale = genpareto.fit(excesses, floc=0)
+        return -c, scale  # scipy's c = -k
+    if method != "lmoments":
+        raise ValueError("Unknown fitting method %s (use lmoments or mle)." % method)
+    x = np.sort(excesses)
+    n = x.size
+    l1 = x.mean()
+    l2 = 2 * np.sum(np.arange(n) / (n - 1) * x) / n - l1
+    k = l1 / l2 - 2
+    return k, (1 + k) * l1
+
+
+def get_pot_quantiles(threshold, k, alpha, events_per_year, return_periods):
+    # T-year flood of a peaks-over-threshold series with events_per_year events (Poisson) and GPD excesses
+    m = events_per_year * np.asarray(return_periods, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if abs(k) > 1e-6:
+            return threshold + alpha / k * (1 - m ** -k)
+        return threshold + alpha * np.log(m)
+
+
+def pot_series(flows_records, threshold=None, events_per_year=3.0, min_separation=7, trough_ratio=0.75):
+    # partial-duration series (one row per event) from cached flow records (load_daily_flows)
+    days, flows = np.asarray(flows_records["day"]), np.asarray(flows_records["Q"], dtype=float)
+    if threshold is None:
+        threshold = select_threshold(days, flows, events_per_year, min_separation, trough_ratio)
+    events = get_pot_events(days, flows, threshold, min_separation, trough_ratio)
+    return pd.DataFrame({"Date": EPOCH + events["day"].astype("timedelta64[D]"),
+                         "Q (CMS)": events["Q"],
+                         "duration (days)": days[np.maximum(events["end"] - 1, 0)] - days[events["start"]] + 1,
+                         "threshold (CMS)": threshold})
+
+
+def pot_frequency(gauges, return_periods=(2, 5, 10, 20, 50, 100, 300, 1000), threshold_quantile=None,
+                  events_per_year=3.0, min_separation=7, trough_ratio=0.75, method="lmoments"):
+    # GPD design floods of many gauges ({gauge: flow records}, e.g., load_gauges); the threshold is the
+    # threshold_quantile of the daily flows or is selected for events_per_year independent events per year
+    rows = []
+    for gauge, records in gauges.items():
+        days, flows = np.asarray(records["day"]), np.asarray(records["Q"], dtype=float)
+        if threshold_quantile is not None:
+            threshold = np.nanquantile(flows, threshold_quantile)
+        else:
+            threshold = select_threshold(days, flows, events_per_year, min_separation, trough_ratio)
+        events = get_pot_events(days, flows, threshold, min_separation, trough_ratio)
+        rate = events["Q"].size / get_record_years(days)
+        k, alpha = fit_gpd(events["Q"] - threshold, method=method)
+        row = {"Gauge": gauge, "threshold (CMS)": threshold, "events": events["Q"].size,
+               "events per year": rate, "shape": k, "scale": alpha}
+        for T, value in zip(return_periods, np.atleast_1d(get_pot_quantiles(threshold, k, alpha, rate, return_periods))):
+            row["HQ%s" % str(T)] = value
+        rows.append(row)
+    logging.info("PEAKS OVER THRESHOLD: {0} GAUGES".format(str(len(rows))))
+    return pd.DataFrame(rows).set_index("Gauge")
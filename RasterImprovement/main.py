@@ -1,7 +1,5 @@
 import numpy as np
 import os
-from osgeo import ogr
-from osgeo import gdal
 
 def raster2array(raster_file_name):
     """
@@ -13,6 +11,7 @@ def raster2array(raster_file_name):
         - array (numpy.ndarray): The raster data as a numpy array.
         - geo_transform (tuple): The geo-transform information of the raster.
     """
+    from osgeo import gdal
     # Open the raster file
     raster = gdal.Open(raster_file_name)
     if not raster:
@@ -33,6 +32,7 @@ def raster2array(raster_file_name):
     return raster, array, geo_transform
 
 def create_shp(shp_file_dir, overwrite=True, **kwargs):
+    from osgeo import ogr
     shp_driver = ogr.GetDriverByName("ESRI Shapefile")
 
     if os.path.exists(shp_file_dir) and overwrite:
@@ -70,6 +70,7 @@ def offset2coords(geo_transform, offset_x, offset_y):
     return coord_x, coord_y
 
 def raster2line(raster_file_name, out_shp_fn, pixel_value):
+    from osgeo import ogr
     # Extract raster data
     raster, array, geo_transform = raster2array(raster_file_name)
 
@@ -102,8 +103,10 @@ def raster2line(raster_file_name, out_shp_fn, pixel_value):
     print(f"Success: Wrote {out_shp_fn}")
 
 
-gdal.UseExceptions()
-source_raster_fn = r"" +  os.path.abspath("") + "/least-cost.tif"
-target_shp_fn = r"" + os.path.abspath("") + "/least-cost.shp"
-pixel_val = 1
-raster2line(source_raster_fn, target_shp_fn, pixel_val)
+if __name__ == "__main__":
+    from osgeo import gdal
+    gdal.UseExceptions()
+    source_raster_fn = r"" +  os.path.abspath("") + "/least-cost.tif"
+    target_shp_fn = r"" + os.path.abspath("") + "/least-cost.shp"
+    pixel_val = 1
+    raster2line(source_raster_fn, target_shp_fn, pixel_val)
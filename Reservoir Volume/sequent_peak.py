@@ -1,8 +1,6 @@
 import glob
 import os
 import numpy as np
-from scipy.signal import argrelextrema
-from scipy.signal import find_peaks
 
 def plot_storage_curve(array_1d, min_indices, max_indices, min_values, max_values):
     """
@@ -109,7 +107,8 @@ def daily2monthly(daily_flow_series):
     return np.array(monthly_stats)
 
 
-def sequent_peak(in_vol_series, out_vol_target):
+def sequent_peak(in_vol_series, out_vol_target, plot=True):
+    from scipy.signal import find_peaks
     # create storage-difference SD dictionary
     SD_dict = {}
 
@@ -136,7 +135,8 @@ def sequent_peak(in_vol_series, out_vol_target):
     max_volumes = storage_line[max_indices]
     min_volumes = storage_line[min_indices]
 
-    plot_storage_curve(storage_line, min_indices, max_indices, min_volumes, max_volumes)
+    if plot:
+        plot_storage_curve(storage_line, min_indices, max_indices, min_volumes, max_volumes)
 
     required_storage = 0.0
     for i, vol in enumerate(max_volumes):
@@ -1,5 +1,18 @@
-import sys, os
-sys.path.append(r'' + os.path.abspath(''))
-__all__ = ['bedload', 'fun', 'grains', 'hec', 'main', 'mpm']
+import importlib
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+__all__ = ['batch', 'bedload', 'critical', 'ensemble', 'formulas', 'fun', 'grains', 'hec', 'main', 'mpm', 'writer']
 
-from main import *
+
+def __getattr__(name):
+    # load main on first use (e.g., sed.GrainReader or sed.main) instead of at import time,
+    # so that importing the package does not load pandas, openpyxl or numpy
+    if name.startswith("__"):
+        raise AttributeError(name)
+    main_module = importlib.import_module("main")
+    if hasattr(main_module, name):
+        return getattr(main_module, name)
+    if name in __all__:
+        return importlib.import_module(name)
+    raise AttributeError("module 'sediment_transport' has no attribute %s" % name)
@@ -0,0 +1,121 @@
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from main import *
+
+
+def get_workbooks(patterns, manifest=None):
+    # expand glob patterns and an optional manifest (one workbook path per line, # for comments)
+    workbooks = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            logging.warning("No HEC-RAS workbook matches %s." % pattern)
+        workbooks += matches
+    if manifest:
+        manifest_dir = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest, mode="r") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    workbooks.append(os.path.join(manifest_dir, line))
+    # remove duplicates and keep the order
+    return list(dict.fromkeys(os.path.abspath(workbook) for workbook in workbooks))
+
+
+def get_output_names(workbooks):
+    # unique output name per workbook: file name, or parent folder + file name if
+    # several model variants use the same file name (e.g., output.xlsx)
+    stems = [os.path.splitext(os.path.basename(workbook))[0] for workbook in workbooks]
+    names = []
+    for workbook, stem in zip(workbooks, stems):
+        if stems.count(stem) > 1:
+            stem = os.path.basename(os.path.dirname(workbook)) + "_" + stem
+        while stem in names:
+            stem += "_"
+        names.append(stem)
+    return names
+
+
+def process_workbook(hec_file, D_char, out_folder, name, out_format="xlsx"):
+    # compute and write the bed load of one workbook and return its summary per scenario (and grain class)
+    hec = HecSet(hec_file)
+    report_file = os.path.join(out_folder, name + "_validity.csv")
+    if isinstance(D_char, pd.Series):
+        mpm_results = calculate_mpm_fractional(hec.hec_data, D_char, report_file=report_file)
+        groups = ["Scenario", "Class"]
+    else:
+        mpm_results = calculate_mpm(hec.hec_data, D_char, report_file=report_file)
+        groups = ["Scenario"]
+    out_file = write_results(mpm_results, os.path.join(out_folder, name + "_bed_load_mpm." + out_format.strip(".")))
+
+    summary = mpm_results.reset_index().groupby(groups, sort=False).agg(**{
+        "Profiles": ("Qb (kg/s)", "size"),
+        "Q max (m3/s)": ("Q (m3/s)", "max"),
+        "Qb mean (kg/s)": ("Qb (kg/s)", "mean"),
+        "Qb max (kg/s)": ("Qb (kg/s)", "max")}).reset_index()
+    summary.insert(0, "Workbook", hec_file)
+    summary.insert(1, "Output", out_file)
+    return summary
+
+
+@log_actions(asynchronous=True, level=logging.INFO)
+def run_batch(workbooks, D_char, out_folder, workers=None, out_format="xlsx", summary_file="summary.csv"):
+    os.makedirs(out_folder, exist_ok=True)
+    names = get_output_names(workbooks)
+    logging.info("PROCESSING {0} WORKBOOKS WITH {1} WORKERS".format(str(len(workbooks)), str(workers or os.cpu_count())))
+    summaries = {}
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker_logging) as pool:
+        futures = {pool.submit(process_workbook, workbook, D_char, out_folder, name, out_format): workbook
+                   for workbook, name in zip(workbooks, names)}
+        for future in as_completed(futures):
+            workbook = futures[future]
+            try:
+                summaries[workbook] = future.result()
+                logging.info("FINISHED %s" % workbook)
+            except Exception as e:
+                logging.error("FAILED %s: %s" % (workbook, str(e)))
+                failed.append(workbook)
+
+    # merged summary in the order of the input workbooks
+    if summaries:
+        summary = pd.concat([summaries[workbook] for workbook in workbooks if workbook in summaries],
+                            ignore_index=True)
+        summary.to_csv(os.path.join(out_folder, summary_file), index=False)
+        logging.info("WROTE SUMMARY TO %s" % os.path.join(out_folder, summary_file))
+    return failed
+
+
+def cli(args=None):
+    parser = argparse.ArgumentParser(description="Compute MPM bed load for many HEC-RAS output workbooks in parallel.")
+    parser.add_argument("workbooks", nargs="*", help="HEC-RAS workbooks or glob patterns (e.g., \"runs/*/output.xlsx\")")
+    parser.add_argument("-m", "--manifest", help="text file with one HEC-RAS workbook per line")
+    parser.add_argument("-g", "--grains", default="grains.csv", help="grain size csv file (default: grains.csv)")
+    parser.add_argument("-d", "--D-char", default="D84",
+                        help="characteristic grain size class or ALL for all classes (default: D84)")
+    parser.add_argument("-o", "--out-folder", default="results", help="output folder (default: results)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("-f", "--format", default="xlsx", choices=[f.strip(".") for f in RESULT_FORMATS],
+                        help="output format per workbook (default: xlsx)")
+    args = parser.parse_args(args)
+
+    workbooks = get_workbooks(args.workbooks, args.manifest)
+    if not workbooks:
+        parser.error("no HEC-RAS workbooks found")
+    grain_sizes = GrainReader(args.grains).size_classes["size"].astype(float)
+    if args.D_char == "ALL":
+        D_char = grain_sizes
+    else:
+        try:
+            D_char = float(grain_sizes[args.D_char])
+        except KeyError:
+            parser.error("grain class %s is not defined in %s" % (args.D_char, args.grains))
+    failed = run_batch(workbooks, D_char, args.out_folder, workers=args.workers, out_format=args.format)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -31,3 +31,43 @@ class BedCore:
         except ValueError:
             logging.warning("Non-numeric data. Returning tau_x=NaN.")
             return np.nan
+
+
+# registry of bed load formulas: name -> array kernel(bed, **params) returning phi
+BED_LOAD_FORMULAS = {}
+
+
+def register_formula(name):
+    def decorator(kernel):
+        BED_LOAD_FORMULAS[name] = kernel
+        return kernel
+    return decorator
+
+
+class BedArray(BedCore):
+    def __init__(self, grain_size, Froude, water_depth,
+                 velocity, Q, hydraulic_radius, slope):
+        # hydraulic arguments are numpy-broadcastable arrays (e.g., HecSet.hec_data columns)
+        BedCore.__init__(self)
+        self.D = np.asarray(grain_size, dtype=float)
+        self.h = np.asarray(water_depth, dtype=float)
+        self.Q = np.asarray(Q, dtype=float)
+        self.Se = np.asarray(slope, dtype=float)
+        self.Rh = np.asarray(hydraulic_radius, dtype=float)
+        self.u = np.asarray(velocity, dtype=float)
+        self.Fr = np.asarray(Froude, dtype=float)
+        self.tau_x = self.compute_tau_x()
+
+    def add_dimensions(self, b, phi=None):
+        if phi is None:
+            phi = self.phi
+        with np.errstate(invalid="ignore"):
+            return phi * np.asarray(b, dtype=float) * np.sqrt((self.s - 1) * self.g * self.D ** 3) * self.rho_s
+
+    def evaluate(self, formula, **params):
+        # evaluate a registered formula kernel on the shared hydraulics and tau_x
+        try:
+            return BED_LOAD_FORMULAS[formula](self, **params)
+        except KeyError:
+            raise KeyError("Unknown bed load formula %s (available: %s)." % (
+                formula, ", ".join(BED_LOAD_FORMULAS.keys())))
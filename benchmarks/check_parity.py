@@ -0,0 +1,115 @@
+"""
+Parity check of the vectorized bed load computation against the scalar MPM class.
+
+Usage (from the repository root):
+    python benchmarks/check_parity.py
+    python benchmarks/check_parity.py --rows 5000 --seed 3
+
+calculate_mpm (MPMArray), calculate_mpm with formulas=["MPM"] and every grain class of
+calculate_mpm_fractional are compared with a per-row loop over the scalar MPM class (the original
+calculate_mpm). The synthetic HEC-RAS table contains the edge cases of the scalar branches: NaN and
+zero slopes, zero water depths, NaN velocities, tau_x at and just above tau_xcr (negative MPM argument)
+and rows without river station. Returns 1 if Phi, Qb or the NaN positions differ.
+"""
+import argparse
+import logging
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from main import calculate_mpm, calculate_mpm_fractional
+from mpm import MPM
+from bedload import BedCore
+from run_benchmarks import synthetic_hec_data
+
+# grain sizes (m) of the fractional check (the first one is also the characteristic grain size)
+GRAIN_SIZES = pd.Series([0.02, 0.0003, 0.004, 0.05], index=["D84", "fine", "D50", "coarse"])
+
+
+def parity_hec_data(n_rows, D_char, seed=0):
+    # random HEC-RAS profiles followed by rows with the edge cases of MPM.compute_phi
+    hec_df = synthetic_hec_data(n_rows, seed=seed)
+    core = BedCore()
+    # slopes with tau_x = tau_xcr and tau_x between tau_xcr and tau_xcr / 0.85 (negative MPM argument)
+    Rh = 1.0
+    Se_cr = core.tau_xcr * (core.s - 1) * D_char / Rh
+    edge_cases = pd.DataFrame({
+        "River Sta": [9001.0, 9002.0, 9003.0, np.nan, 9005.0, 9006.0, 9007.0, np.nan, 9009.0, 9010.0],
+        "Profile": ["NaN slope", "zero depth", "zero slope", "no station", "NaN velocity",
+                    "tau_x = tau_xcr", "negative argument", "", "all NaN", "zero depth and slope"],
+        "Q Total": [10.0, 10.0, 10.0, 10.0, 10.0, 10.0, 10.0, np.nan, np.nan, 10.0],
+        "Froude # Chl": [0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, np.nan, np.nan, 0.5],
+        "Hydr Depth": [1.0, 0.0, 1.0, 1.0, 1.0, 1.0, 1.0, np.nan, np.nan, 0.0],
+        "Hydr Radius": [Rh, Rh, Rh, Rh, Rh, Rh, Rh, np.nan, np.nan, 0.0],
+        "E.G. Slope": [np.nan, 0.005, 0.0, 0.005, 0.005, Se_cr, 1.1 * Se_cr, np.nan, np.nan, 0.0],
+        "Vel Chnl": [1.0, 1.0, 1.0, 1.0, np.nan, 1.0, 1.0, np.nan, np.nan, 0.0],
+        "Flow Area": [20.0, 20.0, 20.0, 20.0, 20.0, 20.0, 20.0, np.nan, np.nan, 0.0],
+    })
+    return pd.concat([hec_df, edge_cases], ignore_index=True)
+
+
+def scalar_mpm(hec_df, D_char):
+    # per-row loop over the scalar MPM class like the original calculate_mpm
+    phi, Qb = [], []
+    for i, sta in enumerate(list(hec_df["River Sta"])):
+        if str(sta).lower() == "nan":
+            continue
+        section_mpm = MPM(grain_size=D_char,
+                          Froude=hec_df["Froude # Chl"][i],
+                          water_depth=hec_df["Hydr Depth"][i],
+                          velocity=hec_df["Vel Chnl"][i],
+                          Q=hec_df["Q Total"][i],
+                          hydraulic_radius=hec_df["Hydr Radius"][i],
+                          slope=hec_df["E.G. Slope"][i])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            b = hec_df["Flow Area"][i] / hec_df["Hydr Depth"][i]
+            Qb.append(section_mpm.add_dimensions(b))
+        phi.append(section_mpm.phi)
+    return np.array(phi, dtype=float), np.array(Qb, dtype=float)
+
+
+def compare(name, values, reference):
+    # number of differing entries (NaN positions must match exactly)
+    values, reference = np.asarray(values, dtype=float), np.asarray(reference, dtype=float)
+    if values.shape != reference.shape:
+        print("%-40s FAILED (shape %s instead of %s)" % (name, values.shape, reference.shape))
+        return max(values.size, reference.size, 1)
+    different = ~np.isclose(values, reference, rtol=1e-12, atol=0.0, equal_nan=True)
+    print("%-40s %s (%i values, %i NaN)" % (name, "ok" if not different.any() else
+                                            "FAILED (%i differ)" % np.count_nonzero(different),
+                                            values.size, np.count_nonzero(np.isnan(reference))))
+    return int(np.count_nonzero(different))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Compare the vectorized MPM computation with the scalar MPM class.")
+    parser.add_argument("--rows", type=int, default=2000, help="random HEC-RAS rows (default: 2000)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    args = parser.parse_args(args)
+    logging.disable(logging.WARNING)  # the scalar MPM class logs every validity violation
+
+    D_char = float(GRAIN_SIZES.iloc[0])
+    hec_df = parity_hec_data(args.rows, D_char, seed=args.seed)
+    n_different = 0
+    phi, Qb = scalar_mpm(hec_df, D_char)
+    for label, results in [("calculate_mpm", calculate_mpm(hec_df, D_char)),
+                           ("calculate_mpm formulas=[MPM]", calculate_mpm(hec_df, D_char, formulas=["MPM"]).rename(
+                               columns={"Phi MPM (-)": "Phi (-)", "Qb MPM (kg/s)": "Qb (kg/s)"}))]:
+        n_different += compare(label + " Phi", results["Phi (-)"], phi)
+        n_different += compare(label + " Qb", results["Qb (kg/s)"], Qb)
+
+    fractional = calculate_mpm_fractional(hec_df, GRAIN_SIZES)
+    for name, D in GRAIN_SIZES.items():
+        phi, Qb = scalar_mpm(hec_df, float(D))
+        results = fractional.xs(name, level="Class")
+        n_different += compare("calculate_mpm_fractional %s Phi" % name, results["Phi (-)"], phi)
+        n_different += compare("calculate_mpm_fractional %s Qb" % name, results["Qb (kg/s)"], Qb)
+    return 1 if n_different else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
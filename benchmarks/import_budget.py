@@ -0,0 +1,89 @@
+"""
+Import-time budget of the package entry points.
+
+Usage (from the repository root):
+    python benchmarks/import_budget.py
+    python benchmarks/import_budget.py --repeat 10 --factor 2
+
+Every entry point is imported in a fresh interpreter (best of --repeat runs) and the time is compared
+with its budget in seconds (times --factor for slow machines). The script also lists the heavy
+dependencies that were actually loaded by the import and returns 1 if an entry point is over budget.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# the repository folder is imported as the sediment_transport package (e.g., by gui.py)
+IMPORT_PACKAGE = ("import importlib.util\n"
+                  "spec = importlib.util.spec_from_file_location('sediment_transport', os.path.join(ROOT, '__init__.py'),"
+                  " submodule_search_locations=[ROOT])\n"
+                  "sys.modules['sediment_transport'] = importlib.util.module_from_spec(spec)\n"
+                  "spec.loader.exec_module(sys.modules['sediment_transport'])\n")
+
+# entry point: (import statement, budget in seconds)
+IMPORT_BUDGETS = {
+    "sediment_transport": (IMPORT_PACKAGE, 0.05),
+    "main": ("import main", 0.35),
+    "batch": ("import batch", 0.35),
+    "gui": (IMPORT_PACKAGE + "import gui", 0.35),
+}
+
+# dependencies that must only be loaded at first use
+HEAVY_MODULES = ["pandas", "openpyxl", "matplotlib", "scipy", "osgeo", "sklearn", "fitter"]
+
+PROBE = """
+import os, sys, time
+ROOT = %r
+sys.path.insert(0, ROOT)
+start = time.perf_counter()
+%s
+seconds = time.perf_counter() - start
+# lazy modules (see fun.lazy_import) are registered in sys.modules but only count once they are executed
+loaded = [name for name in %r if name in sys.modules and type(sys.modules[name]).__name__ != "_LazyModule"]
+print(seconds)
+print(",".join(loaded))
+"""
+
+
+def measure_import(statement, repeat=5):
+    # best of repeat fresh interpreters; returns (seconds, loaded heavy modules)
+    best, loaded = None, []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", PROBE % (ROOT, statement, HEAVY_MODULES)],
+                                cwd=ROOT, capture_output=True, text=True, check=True).stdout.split("\n")
+        seconds = float(output[0])
+        if best is None or seconds < best:
+            best = seconds
+        loaded = [name for name in output[1].split(",") if name]
+    return best, loaded
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Check the import time of the package entry points.")
+    parser.add_argument("--only", nargs="*", choices=list(IMPORT_BUDGETS.keys()), help="check selected entry points only")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per entry point (best is reported)")
+    parser.add_argument("--factor", type=float, default=1.0, help="budget multiplier (default: 1.0)")
+    args = parser.parse_args(args)
+
+    over_budget = []
+    for name in args.only or IMPORT_BUDGETS.keys():
+        statement, budget = IMPORT_BUDGETS[name]
+        try:
+            seconds, loaded = measure_import(statement, repeat=args.repeat)
+        except subprocess.CalledProcessError as e:
+            # e.g., tkinter is not available
+            print("%-20s failed (%s)" % (name, e.stderr.strip().split("\n")[-1]))
+            continue
+        status = "ok" if seconds <= budget * args.factor else "OVER BUDGET"
+        if status != "ok":
+            over_budget.append(name)
+        print("%-20s %8.3f s  (budget %.3f s)  %-11s loaded: %s" % (name, seconds, budget * args.factor, status,
+                                                                 ", ".join(loaded) or "-"))
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
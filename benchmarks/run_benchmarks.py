@@ -0,0 +1,263 @@
+"""
+Reproducible timing and memory benchmarks for the compute hot paths of the repository.
+
+Usage (from the repository root):
+    python benchmarks/run_benchmarks.py --scale small
+    python benchmarks/run_benchmarks.py --scale basin --repeat 1 --output basin.json --compare small.json
+
+Every benchmark generates synthetic data with a fixed seed, times the best of --repeat runs
+(time.perf_counter) and measures the peak memory of one extra run with tracemalloc. Results are
+written as JSON (default: benchmarks/results/<scale>-<timestamp>.json); --compare flags benchmarks
+that are slower than a previous result file by more than --tolerance.
+"""
+import argparse
+import datetime
+import importlib
+import importlib.util
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# problem sizes per scale: HEC-RAS rows, normal depth solves, reservoir years, raster megapixels, daily flow years
+SCALES = {
+    "small": {"rows": 1000, "solves": 1000, "years": 10, "megapixels": 0.25, "flow_years": 50},
+    "medium": {"rows": 100000, "solves": 10000, "years": 100, "megapixels": 4.0, "flow_years": 190},
+    "basin": {"rows": 1000000, "solves": 100000, "years": 1000, "megapixels": 25.0, "flow_years": 2000},
+}
+
+
+def load_module(name, relative_path):
+    # load a module by file path (several folders contain spaces or modules named main.py)
+    path = os.path.join(ROOT, relative_path)
+    sys.path.insert(0, os.path.dirname(path))
+    try:
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.pop(0)
+    return module
+
+
+def synthetic_hec_data(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    n_profiles = 5
+    return pd.DataFrame({
+        "River Sta": np.repeat(np.arange(n_rows // n_profiles + 1, dtype=float), n_profiles)[:n_rows],
+        "Profile": np.tile(["Q mean", "HQ2.33", "HQ5", "HQ10", "HQ100"], n_rows // n_profiles + 1)[:n_rows],
+        "Q Total": rng.uniform(1.0, 500.0, n_rows),
+        "Froude # Chl": rng.uniform(0.1, 1.2, n_rows),
+        "Hydr Depth": rng.uniform(0.2, 5.0, n_rows),
+        "Hydr Radius": rng.uniform(0.2, 4.0, n_rows),
+        "E.G. Slope": rng.uniform(0.0001, 0.01, n_rows),
+        "Vel Chnl": rng.uniform(0.2, 3.0, n_rows),
+        "Flow Area": rng.uniform(1.0, 300.0, n_rows),
+    })
+
+
+def synthetic_daily_flows(n_years, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("1826-01-01", periods=int(n_years * 365.25), freq="D")
+    seasonal = 300.0 + 200.0 * np.sin(2 * np.pi * dates.dayofyear.to_numpy() / 365.25)
+    return pd.DataFrame({"Q (CMS)": seasonal * rng.lognormal(0.0, 0.5, dates.size)},
+                        index=pd.Index(dates, name="Date"))
+
+
+def write_reservoir_files(directory, n_years, seed=0):
+    # one daily_flows_YYYY.csv (31 days x 12 months, ";" delimited) per year like Reservoir Volume/flows
+    rng = np.random.default_rng(seed)
+    for year in range(1900, 1900 + n_years):
+        flows = rng.lognormal(1.0, 0.6, (31, 12))
+        np.savetxt(os.path.join(directory, "daily_flows_%i.csv" % year), flows, fmt="%.3f", delimiter=";")
+
+
+def write_raster(file_name, megapixels, seed=0):
+    # square raster of zeros with a random-walk path of ones (one pixel per column)
+    from osgeo import gdal
+    n = int(np.sqrt(megapixels * 1e6))
+    rng = np.random.default_rng(seed)
+    array = np.zeros((n, n), dtype=np.uint8)
+    rows = np.clip(n // 2 + np.cumsum(rng.integers(-1, 2, n)), 0, n - 1)
+    array[rows, np.arange(n)] = 1
+    raster = gdal.GetDriverByName("GTiff").Create(file_name, n, n, 1, gdal.GDT_Byte)
+    raster.SetGeoTransform((0.0, 1.0, 0.0, float(n), 0.0, -1.0))
+    raster.GetRasterBand(1).WriteArray(array)
+    raster.FlushCache()
+    raster = None
+
+
+def bench_calculate_mpm(size, tmp_dir):
+    sys.path.insert(0, ROOT)
+    sediment = importlib.import_module("main")
+    hec_df = synthetic_hec_data(size["rows"])
+    return size["rows"], "rows", lambda: sediment.calculate_mpm(hec_df, 0.0061)
+
+
+def bench_interpolate_h(size, tmp_dir):
+    get_h = load_module("get_h", os.path.join("1d Hydraulics", "get_h.py"))
+    get_h.n_m = 1 / 20  # interpolate_h reads Manning's n from the module
+    rng = np.random.default_rng(0)
+    cases = list(zip(rng.uniform(1.0, 500.0, size["solves"]), rng.uniform(2.0, 50.0, size["solves"]),
+                     rng.uniform(0.5, 3.0, size["solves"]), rng.uniform(0.0005, 0.01, size["solves"])))
+
+    def run():
+        return [get_h.interpolate_h(Q, b, m_bank, S) for Q, b, m_bank, S in cases]
+    return size["solves"], "solves", run
+
+
+def bench_solve_normal_depth(size, tmp_dir):
+    get_h = load_module("get_h", os.path.join("1d Hydraulics", "get_h.py"))
+    rng = np.random.default_rng(0)
+    Q, b = rng.uniform(1.0, 500.0, size["solves"]), rng.uniform(2.0, 50.0, size["solves"])
+    m_bank, S = rng.uniform(0.5, 3.0, size["solves"]), rng.uniform(0.0005, 0.01, size["solves"])
+    return size["solves"], "solves", lambda: get_h.solve_normal_depth(Q, b, m_bank, S, n_m=1 / 20)
+
+
+def bench_rating_table(size, tmp_dir):
+    # repeated depth queries for one channel (the table is built once and then served from the cache)
+    get_h = load_module("get_h", os.path.join("1d Hydraulics", "get_h.py"))
+    Q = np.random.default_rng(0).uniform(1.0, 500.0, size["solves"])
+    return size["solves"], "solves", lambda: get_h.get_rating_table(5.1, 2.5, 0.005, n_m=1 / 20).get_h(Q)
+
+
+def bench_reservoir_read_data(size, tmp_dir):
+    sequent = load_module("sequent_peak", os.path.join("Reservoir Volume", "sequent_peak.py"))
+    write_reservoir_files(tmp_dir, size["years"])
+    return size["years"], "files", lambda: sequent.read_data(directory=tmp_dir, fn_prefix="daily_flows_",
+                                                               fn_suffix="", ftype="csv", delimiter=";")
+
+
+def bench_reservoir_daily2monthly(size, tmp_dir):
+    sequent = load_module("sequent_peak", os.path.join("Reservoir Volume", "sequent_peak.py"))
+    rng = np.random.default_rng(0)
+    daily = [rng.lognormal(1.0, 0.6, (31, 12)).astype(np.float32) for _ in range(size["years"])]
+    return size["years"], "years", lambda: [sequent.daily2monthly(flows) for flows in daily]
+
+
+def bench_reservoir_sequent_peak(size, tmp_dir):
+    sequent = load_module("sequent_peak", os.path.join("Reservoir Volume", "sequent_peak.py"))
+    rng = np.random.default_rng(0)
+    monthly = {1900 + i: rng.lognormal(1.0, 0.6, 12) for i in range(size["years"])}
+    supply = np.array([1.5, 1.5, 1.5, 2.0, 4.0, 4.0, 4.0, 5.0, 5.0, 3.0, 2.0, 1.5])
+    return size["years"] * 12, "months", lambda: sequent.sequent_peak(monthly, supply, plot=False)
+
+
+def bench_raster2line(size, tmp_dir):
+    from osgeo import gdal
+    gdal.UseExceptions()
+    raster_main = load_module("raster_improvement", os.path.join("RasterImprovement", "main.py"))
+    raster_file = os.path.join(tmp_dir, "path.tif")
+    write_raster(raster_file, size["megapixels"])
+    pixels = int(np.sqrt(size["megapixels"] * 1e6)) ** 2
+    return pixels, "pixels", lambda: raster_main.raster2line(raster_file, os.path.join(tmp_dir, "path.shp"), 1)
+
+
+def bench_annual_max_ranking(size, tmp_dir):
+    discharge = load_module("discharge_analysis", os.path.join("Flood Return Periods", "discharge_analysis.py"))
+    df = synthetic_daily_flows(size["flow_years"])
+    return df.shape[0], "days", lambda: discharge.rank_annual_max(discharge.get_annual_max(df))
+
+
+BENCHMARKS = {
+    "calculate_mpm": bench_calculate_mpm,
+    "interpolate_h": bench_interpolate_h,
+    "solve_normal_depth": bench_solve_normal_depth,
+    "rating_table": bench_rating_table,
+    "reservoir.read_data": bench_reservoir_read_data,
+    "reservoir.daily2monthly": bench_reservoir_daily2monthly,
+    "reservoir.sequent_peak": bench_reservoir_sequent_peak,
+    "raster2line": bench_raster2line,
+    "annual_max_ranking": bench_annual_max_ranking,
+}
+
+
+def run_benchmark(name, scale, repeat=3):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        try:
+            n_items, unit, run = BENCHMARKS[name](SCALES[scale], tmp_dir)
+        except ImportError as e:
+            # e.g., osgeo (GDAL) or scipy are not installed
+            return {"name": name, "scale": scale, "skipped": "missing dependency: %s" % str(e)}
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    best = min(times)
+    return {"name": name, "scale": scale, "items": n_items, "unit": unit,
+            "seconds": best, "seconds_all": times,
+            "throughput": n_items / best if best > 0 else None,
+            "peak_memory_mb": peak / 2 ** 20}
+
+
+def compare(results, baseline_file, tolerance):
+    # ratio > 1 + tolerance = regression
+    with open(baseline_file, mode="r") as f:
+        baseline = {(r["name"], r["scale"]): r for r in json.load(f)["results"] if "seconds" in r}
+    regressions = []
+    for result in results:
+        old = baseline.get((result["name"], result["scale"]))
+        if old is None or "seconds" not in result:
+            continue
+        result["baseline_seconds"] = old["seconds"]
+        result["ratio"] = result["seconds"] / old["seconds"]
+        if result["ratio"] > 1 + tolerance:
+            regressions.append(result)
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark the compute hot paths of the repository.")
+    parser.add_argument("--scale", choices=list(SCALES.keys()), default="small")
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS.keys()), help="run selected benchmarks only")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark (best is reported)")
+    parser.add_argument("--output", help="JSON result file")
+    parser.add_argument("--compare", help="previous JSON result file for regression checks")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs. --compare (default: 0.2)")
+    args = parser.parse_args(args)
+    logging.disable(logging.WARNING)  # validity warnings of synthetic data are not part of the benchmark
+
+    results = []
+    for name in args.only or BENCHMARKS.keys():
+        result = run_benchmark(name, args.scale, repeat=args.repeat)
+        results.append(result)
+        if "skipped" in result:
+            print("%-26s skipped (%s)" % (name, result["skipped"]))
+        else:
+            print("%-26s %10.4f s  %14.1f %s/s  %9.1f MB" % (name, result["seconds"], result["throughput"],
+                                                            result["unit"], result["peak_memory_mb"]))
+
+    regressions = compare(results, args.compare, args.tolerance) if args.compare else []
+    for result in regressions:
+        print("REGRESSION %s (%s): %.2fx slower than baseline" % (result["name"], result["scale"], result["ratio"]))
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", "%s-%s.json" % (
+        args.scale, datetime.datetime.now().strftime("%Y%m%d-%H%M%S")))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, mode="w") as f:
+        json.dump({"created": datetime.datetime.now().isoformat(timespec="seconds"),
+                   "python": platform.python_version(),
+                   "platform": platform.platform(),
+                   "numpy": np.__version__,
+                   "pandas": pd.__version__,
+                   "scale": args.scale,
+                   "results": results}, f, indent=2)
+    print("Wrote %s" % output)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+from hec import *
+from bedload import *
+
+
+def calculate_critical_discharge(hec_df, grain_sizes, tau_xcr=None, extrapolate=True, max_extrapolation=10.0):
+    # discharge at which tau_x = tau_xcr for every river station and grain class
+    # grain_sizes: float or pandas Series of grain sizes (m) indexed by class (GrainReader.size_classes["size"])
+    # per station, Se * Rh is interpolated linearly in log(Q)-log(Se * Rh) space between the profiles and the
+    # first crossing of tau_xcr * (s - 1) * D is returned; with extrapolate=True the first or last segment is
+    # extended beyond the profile range up to max_extrapolation times the highest (or 1 / max_extrapolation
+    # times the lowest) profile discharge (None = no limit), otherwise stations without crossing get NaN
+    # the boolean "extrapolated <class>" columns flag the Qcr values outside the profile range
+    if not isinstance(grain_sizes, pd.Series):
+        grain_sizes = pd.Series([float(grain_sizes)], index=["D"])
+    core = BedCore()
+    if tau_xcr is None:
+        tau_xcr = core.tau_xcr
+    hec_df = get_profiles(hec_df)
+    codes, stations = pd.factorize(hec_df["River Sta"], sort=False)
+    Q = hec_df["Q Total"].to_numpy(dtype=float)
+    with np.errstate(invalid="ignore"):
+        stress = hec_df["E.G. Slope"].to_numpy(dtype=float) * hec_df["Hydr Radius"].to_numpy(dtype=float)
+        valid = (Q > 0) & (stress > 0)
+
+    # stations x profiles arrays sorted by discharge (NaN padding for stations with fewer profiles)
+    order = np.lexsort((Q[valid], codes[valid]))
+    station_codes = codes[valid][order]
+    counts = np.bincount(station_codes, minlength=stations.size)
+    position = np.arange(station_codes.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    n_profiles = max(int(counts.max()) if counts.size else 0, 2)
+    log_Q = np.full((stations.size, n_profiles), np.nan)
+    log_stress = np.full((stations.size, n_profiles), np.nan)
+    log_Q[station_codes, position] = np.log(Q[valid][order])
+    log_stress[station_codes, position] = np.log(stress[valid][order])
+
+    # segments (axis 1) against grain classes (axis 2)
+    target = np.log(tau_xcr * (core.s - 1) * grain_sizes.to_numpy(dtype=float))[np.newaxis, np.newaxis, :]
+    x0, x1 = log_Q[:, :-1, np.newaxis], log_Q[:, 1:, np.newaxis]
+    y0, y1 = log_stress[:, :-1, np.newaxis], log_stress[:, 1:, np.newaxis]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_cross = np.where(y1 != y0, x0 + (target - y0) * (x1 - x0) / (y1 - y0), x0)
+        crossing = (y0 - target) * (y1 - target) <= 0
+    first = np.argmax(crossing, axis=1)[:, np.newaxis, :]
+    log_Q_cr = np.where(crossing.any(axis=1), np.take_along_axis(x_cross, first, axis=1)[:, 0, :], np.nan)
+    extrapolated = np.zeros(log_Q_cr.shape, dtype=bool)
+
+    if extrapolate:
+        # extend the first rising segment below the lowest profile and the last one above the highest profile
+        rows = np.arange(stations.size)
+        last = np.maximum(counts - 1, 1)
+        below = target[0] < log_stress[:, 0, np.newaxis]
+        above = target[0] > log_stress[rows, last][:, np.newaxis]
+        for i_a, i_b, outside in [(0, 1, below), (last - 1, last, above)]:
+            xa, xb = log_Q[rows, i_a][:, np.newaxis], log_Q[rows, i_b][:, np.newaxis]
+            ya, yb = log_stress[rows, i_a][:, np.newaxis], log_stress[rows, i_b][:, np.newaxis]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                x_end = xa + (target[0] - ya) * (xb - xa) / (yb - ya)
+                extended = np.isnan(log_Q_cr) & (yb > ya) & outside
+                log_Q_cr = np.where(extended, x_end, log_Q_cr)
+            extrapolated |= extended
+        if max_extrapolation is not None:
+            # no solution if the extension reaches too far beyond the lowest or highest profile discharge
+            log_limit = np.log(max_extrapolation)
+            with np.errstate(invalid="ignore"):
+                beyond = extrapolated & ((log_Q_cr < log_Q[:, 0, np.newaxis] - log_limit) |
+                                         (log_Q_cr > log_Q[rows, last][:, np.newaxis] + log_limit))
+            if beyond.any():
+                logging.warning("CRITICAL DISCHARGE: {0} VALUES BEYOND {1} TIMES THE PROFILE RANGE SET TO NaN".format(
+                    str(int(beyond.sum())), str(max_extrapolation)))
+            log_Q_cr = np.where(beyond, np.nan, log_Q_cr)
+            extrapolated &= ~beyond
+
+    Q_cr = pd.DataFrame(np.exp(log_Q_cr), index=pd.Index(stations, name="River Sta"),
+                        columns=["Qcr {0} (m3/s)".format(str(name)) for name in grain_sizes.index])
+    for name, flags in zip(grain_sizes.index, extrapolated.T):
+        Q_cr["extrapolated {0}".format(str(name))] = flags
+    logging.info("CRITICAL DISCHARGE: {0} STATIONS, {1} GRAIN CLASSES, {2} WITHOUT SOLUTION, {3} EXTRAPOLATED".format(
+        str(stations.size), str(grain_sizes.size), str(int(np.isnan(log_Q_cr).sum())), str(int(extrapolated.sum()))))
+    return Q_cr
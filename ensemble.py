@@ -0,0 +1,88 @@
+import inspect
+from concurrent.futures import ProcessPoolExecutor
+from hec import *
+from formulas import *
+
+# parameters that can be perturbed; distributions are given as (numpy Generator method, *args), e.g.
+# {"D": ("lognormal", np.log(0.02), 0.2), "tau_xcr": ("uniform", 0.03, 0.06),
+#  "s": ("normal", 2.68, 0.05), "slope_factor": ("normal", 1.0, 0.1)}
+ENSEMBLE_PARAMETERS = ["D", "tau_xcr", "s", "slope_factor"]
+
+
+def sample_parameters(D_char, distributions, n_realizations, seed=None):
+    # draw one value per realization and parameter; parameters without distribution are fixed
+    core = BedCore()
+    params = {"D": np.full(n_realizations, float(D_char)),
+              "tau_xcr": np.full(n_realizations, core.tau_xcr),
+              "s": np.full(n_realizations, core.s),
+              "slope_factor": np.ones(n_realizations)}
+    rng = np.random.default_rng(seed)
+    for name, distribution in distributions.items():
+        if name not in ENSEMBLE_PARAMETERS:
+            raise KeyError("Cannot sample %s (use one of %s)." % (name, ", ".join(ENSEMBLE_PARAMETERS)))
+        params[name] = getattr(rng, distribution[0])(*distribution[1:], size=n_realizations)
+    return params
+
+
+def compute_ensemble_block(hydraulics, params, percentiles, formula="MPM", sampled=()):
+    # evaluate all realizations (axis 0) for a block of profiles (axis 1) and
+    # return the Qb percentiles with shape (len(percentiles), profiles)
+    # sampled: names of the perturbed parameters (a sampled tau_xcr replaces the default of the formula)
+    realization = {name: values[:, np.newaxis] for name, values in params.items()}
+    bed = BedArray(grain_size=realization["D"],
+                   Froude=hydraulics["Fr"][np.newaxis, :],
+                   water_depth=hydraulics["h"][np.newaxis, :],
+                   velocity=hydraulics["u"][np.newaxis, :],
+                   Q=hydraulics["Q"][np.newaxis, :],
+                   hydraulic_radius=hydraulics["Rh"][np.newaxis, :],
+                   slope=realization["slope_factor"] * hydraulics["Se"][np.newaxis, :])
+    bed.s = realization["s"]
+    bed.rho_s = bed.s * 1000.0  # kg/m3 grain density from relative density (water: 1000 kg/m3)
+    bed.tau_xcr = realization["tau_xcr"]
+    bed.tau_x = bed.compute_tau_x()
+    formula_params = {"tau_xcr": bed.tau_xcr} if "tau_xcr" in sampled else {}
+    Qb = bed.add_dimensions(hydraulics["b"][np.newaxis, :], bed.evaluate(formula, **formula_params))
+    return np.percentile(Qb, percentiles, axis=0)
+
+
+def calculate_mpm_ensemble(hec_df, D_char, distributions, n_realizations=1000, percentiles=(5, 50, 95),
+                           seed=None, block_size=1000, workers=None, formula="MPM"):
+    # Monte Carlo uncertainty bands of Qb per profile; realizations are a vectorized array axis and
+    # profiles are processed in blocks of block_size (optionally on a pool of worker processes)
+    if formula not in BED_LOAD_FORMULAS:
+        raise KeyError("Unknown bed load formula %s (available: %s)." % (formula, ", ".join(BED_LOAD_FORMULAS.keys())))
+    if "tau_xcr" in distributions and "tau_xcr" not in inspect.signature(BED_LOAD_FORMULAS[formula]).parameters:
+        raise ValueError("The bed load formula %s does not use tau_xcr (remove it from distributions)." % formula)
+    hec_df = get_profiles(hec_df)
+    logging.info("PROCESSING {0} PROFILES WITH {1} REALIZATIONS".format(str(hec_df.shape[0]), str(n_realizations)))
+    params = sample_parameters(D_char, distributions, n_realizations, seed=seed)
+
+    h = hec_df["Hydr Depth"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        b = hec_df["Flow Area"].to_numpy(dtype=float) / h
+    hydraulics = {"Fr": hec_df["Froude # Chl"].to_numpy(dtype=float),
+                  "h": h,
+                  "u": hec_df["Vel Chnl"].to_numpy(dtype=float),
+                  "Q": hec_df["Q Total"].to_numpy(dtype=float),
+                  "Rh": hec_df["Hydr Radius"].to_numpy(dtype=float),
+                  "Se": hec_df["E.G. Slope"].to_numpy(dtype=float),
+                  "b": b}
+    blocks = [{name: values[i:i + block_size] for name, values in hydraulics.items()}
+              for i in range(0, hec_df.shape[0], block_size)]
+    block_args = (blocks, [params] * len(blocks),
+                  [percentiles] * len(blocks), [formula] * len(blocks), [list(distributions)] * len(blocks))
+    if workers:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker_logging) as pool:
+            bands = list(pool.map(compute_ensemble_block, *block_args))
+    else:
+        bands = list(map(compute_ensemble_block, *block_args))
+    bands = np.concatenate(bands, axis=1) if bands else np.empty((len(percentiles), 0))
+
+    ensemble_dict = {
+            "River Sta": hec_df["River Sta"].to_numpy(),
+            "Scenario": hec_df["Profile"].to_numpy(),
+            "Q (m3/s)": hydraulics["Q"]
+    }
+    for percentile, band in zip(percentiles, bands):
+        ensemble_dict["Qb P{0} (kg/s)".format(str(percentile))] = band
+    return pd.DataFrame(ensemble_dict)
@@ -1,15 +1,245 @@
+import datetime
+import importlib.util
+import json
 import logging
+import os
+import queue
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
 
 
-def start_logging():
-    logging.basicConfig(filename="logfile.log", format="[%(asctime)s] %(message)s",
-                        filemode="w", level=logging.DEBUG)
-    logging.getLogger().addHandler(logging.StreamHandler())
+def lazy_import(name):
+    # module that is only loaded at first attribute access, e.g. pd = lazy_import("pandas")
+    # (keeps the import of the package and short command line calls fast)
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError("No module named %s." % name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
 
 
-def log_actions(fun):
-    def wrapper(*args, **kwargs):
-        start_logging()
-        fun(*args, **kwargs)
-        logging.shutdown()  # important or else the logfile will be locked
-    return wrapper
\ No newline at end of file
+class BlockingQueueHandler(QueueHandler):
+    def enqueue(self, record):
+        # wait for the writer thread when the bounded queue is full instead of dropping records
+        self.queue.put(record)
+
+
+# root logger level and handlers before every start_logging call (restored by stop_logging)
+saved_logging = []
+
+
+def start_logging(level=logging.DEBUG, asynchronous=False, queue_size=10000):
+    # a run logs only to its own handlers; handlers installed before (e.g., by an implicit basicConfig of a
+    # module-level logging call) are removed for the run and restored by stop_logging
+    root = logging.getLogger()
+    saved_logging.append((root.level, root.handlers[:]))
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    if not asynchronous:
+        logging.basicConfig(filename="logfile.log", format="[%(asctime)s] %(message)s",
+                            filemode="w", level=level)
+        logging.getLogger().addHandler(logging.StreamHandler())
+        return None
+
+    # the compute thread only puts records on a bounded queue and a background
+    # QueueListener thread writes them to the logfile and the terminal
+    file_handler = logging.FileHandler("logfile.log", mode="w")
+    file_handler.setFormatter(logging.Formatter("[%(asctime)s] %(message)s"))
+    log_queue = queue.Queue(maxsize=queue_size)
+    listener = QueueListener(log_queue, file_handler, logging.StreamHandler())
+    root.setLevel(level)
+    root.addHandler(BlockingQueueHandler(log_queue))
+    listener.start()
+    return listener
+
+
+def stop_logging(listener=None):
+    root = logging.getLogger()
+    if listener is not None:
+        # write all queued records before the handlers are closed
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+    # close the handlers of the run (important or else the logfile will be locked)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    if saved_logging:
+        level, handlers = saved_logging.pop()
+        root.setLevel(level)
+        for handler in handlers:
+            root.addHandler(handler)
+
+
+def init_worker_logging(level=logging.WARNING):
+    # initializer for worker processes: the logging queue of the parent process has no listener
+    # in a forked child, so workers write their own records to the terminal
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    logging.basicConfig(format="[%(asctime)s] %(message)s", level=level)
+
+
+class RunReport:
+    def __init__(self, name, trace_memory=False):
+        # wall time, CPU time and (optionally) tracemalloc peak memory of a run and its named stages
+        self.name = name
+        self.trace_memory = trace_memory
+        self.started = datetime.datetime.now().isoformat(timespec="seconds")
+        self.stages = []
+        self.stack = []  # running peak memory of the open stages
+        self.error = None
+
+    def get_peak(self):
+        return tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+
+    def begin(self):
+        if self.trace_memory and self.stack:
+            # keep the peak of the enclosing stage before the counter is reset
+            self.stack[-1] = max(self.stack[-1], self.get_peak())
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        self.stack.append(0)
+        return time.perf_counter(), time.process_time()
+
+    def end(self, name, wall_start, cpu_start):
+        peak = self.stack.pop()
+        if self.trace_memory:
+            peak = max(peak, self.get_peak())
+            if self.stack:
+                self.stack[-1] = max(self.stack[-1], peak)
+        stage = {"name": name,
+                 "depth": len(self.stack),
+                 "wall_s": time.perf_counter() - wall_start,
+                 "cpu_s": time.process_time() - cpu_start,
+                 "peak_memory_mb": peak / 2 ** 20 if self.trace_memory else None}
+        self.stages.append(stage)
+        return stage
+
+
+# report of the running instrumented log_actions call (None = instrumentation off)
+active_report = None
+# environment variables that switch on trace_memory and profile of log_actions at runtime
+# (e.g., SEDIMENT_TRACE_MEMORY=1 python main.py), regardless of the decorator arguments
+TRACE_MEMORY_VARIABLE = "SEDIMENT_TRACE_MEMORY"
+PROFILE_VARIABLE = "SEDIMENT_PROFILE"
+# environment variable with the folder of run_report.json and run_profile.prof (overrides report_dir)
+REPORT_DIR_VARIABLE = "SEDIMENT_REPORT_DIR"
+
+
+def get_switch(variable, default=False):
+    # True/False from an environment variable (1, true, yes, on or 0, false, no, off); default if unset
+    value = os.environ.get(variable, "").strip().lower()
+    if value in ["1", "true", "yes", "on"]:
+        return True
+    if value in ["0", "false", "no", "off"]:
+        return False
+    return default
+
+
+@contextmanager
+def stage(name):
+    # time a named stage, e.g. with stage("workbook load"): ...; no-op without an instrumented run
+    if active_report is None:
+        yield
+        return
+    wall_start, cpu_start = active_report.begin()
+    try:
+        yield
+    finally:
+        stage_info = active_report.end(name, wall_start, cpu_start)
+        logging.debug("STAGE {0}: {1:.3f} s wall, {2:.3f} s CPU".format(name, stage_info["wall_s"], stage_info["cpu_s"]))
+
+
+def write_run_report(report, run_info, profiler=None, report_dir=None):
+    # machine-readable run_report.json and the cProfile statistics run_profile.prof in report_dir (created if
+    # needed; default: the current working directory, where logfile.log is written); returns the report file
+    report_dir = os.path.abspath(report_dir or os.getcwd())
+    os.makedirs(report_dir, exist_ok=True)
+    report_file = os.path.join(report_dir, "run_report.json")
+    profile_file = os.path.join(report_dir, "run_profile.prof")
+    run_report = {"function": report.name, "started": report.started, "error": report.error}
+    run_report.update(run_info)
+    run_report["stages"] = [info for info in report.stages if info["depth"] > 0]
+    if profiler is not None:
+        import pstats
+        profiler.dump_stats(profile_file)
+        stats = pstats.Stats(profiler)
+        top = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:25]
+        run_report["profile"] = {"file": profile_file,
+                                 "top_cumulative": [{"function": "%s:%i(%s)" % key,
+                                                     "ncalls": value[1],
+                                                     "tottime_s": value[2],
+                                                     "cumtime_s": value[3]} for key, value in top]}
+    with open(report_file, mode="w") as f:
+        json.dump(run_report, f, indent=2)
+    return report_file
+
+
+def log_actions(fun=None, asynchronous=False, level=logging.DEBUG, queue_size=10000,
+                instrument=False, trace_memory=False, profile=False, report_dir=None):
+    # use as @log_actions or @log_actions(asynchronous=True, level=logging.INFO, queue_size=1000)
+    # instrument=True writes run_report.json with wall and CPU time per stage (see stage);
+    # trace_memory=True adds tracemalloc peak memory (slows down allocation-heavy code) and
+    # profile=True adds a cProfile capture (run_profile.prof and the top functions in the report);
+    # the SEDIMENT_TRACE_MEMORY and SEDIMENT_PROFILE environment variables override both per call;
+    # report_dir (or SEDIMENT_REPORT_DIR) is the folder of the report files (see write_run_report)
+    # tracemalloc is only started and stopped here if it is not already tracing (e.g., by the caller)
+    def decorator(fun):
+        def wrapper(*args, **kwargs):
+            global active_report
+            trace_memory_run = get_switch(TRACE_MEMORY_VARIABLE, trace_memory)
+            profile_run = get_switch(PROFILE_VARIABLE, profile)
+            listener = start_logging(level=level, asynchronous=asynchronous, queue_size=queue_size)
+            if not (instrument or trace_memory_run or profile_run):
+                try:
+                    return fun(*args, **kwargs)
+                finally:
+                    stop_logging(listener)
+
+            active_report = RunReport(fun.__name__, trace_memory=trace_memory_run)
+            own_trace = trace_memory_run and not tracemalloc.is_tracing()
+            if own_trace:
+                tracemalloc.start()
+            profiler = None
+            if profile_run:
+                import cProfile
+                profiler = cProfile.Profile()
+            wall_start, cpu_start = active_report.begin()
+            try:
+                if profiler is not None:
+                    profiler.enable()
+                return fun(*args, **kwargs)
+            except Exception as e:
+                active_report.error = repr(e)
+                raise
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                run_info = active_report.end("total", wall_start, cpu_start)
+                if own_trace:
+                    tracemalloc.stop()
+                try:
+                    report_file = write_run_report(active_report, {"wall_s": run_info["wall_s"],
+                                                                   "cpu_s": run_info["cpu_s"],
+                                                                   "peak_memory_mb": run_info["peak_memory_mb"]},
+                                                   profiler, os.environ.get(REPORT_DIR_VARIABLE) or report_dir)
+                    logging.info("WROTE RUN REPORT {0}".format(report_file))
+                except OSError:
+                    logging.warning("Could not write run_report.json.")
+                active_report = None
+                stop_logging(listener)
+        return wrapper
+
+    if fun is None:
+        return decorator
+    return decorator(fun)
@@ -1,4 +1,6 @@
-import pandas as pd
+from fun import lazy_import
+
+pd = lazy_import("pandas")  # loaded at first use
 
 
 class GrainReader:
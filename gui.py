@@ -4,6 +4,8 @@ from tkinter import ttk  # for Combobox widget
 from tkinter.messagebox import askokcancel, showinfo  # infoboxes
 from tkinter.filedialog import askopenfilename, askdirectory  # select files or folders
 import webbrowser  # open files or URLs from string-type directories
+import queue  # messages from the computation thread to the Tk event loop
+import threading  # run the computation without freezing the window
 import sediment_transport as sed
 
 
@@ -13,7 +15,7 @@ class SediApp(tk.Frame):
         self.master.title("Sedi App")
         #self.master.iconbitmap("Exercise-gui/graphs/icon.ico")
         ww = 628  # width
-        wh = 382  # height
+        wh = 420  # height
         # screen position
         wx = (self.master.winfo_screenwidth() - ww) / 2
         wy = (self.master.winfo_screenheight() - wh) / 2
@@ -45,6 +47,14 @@ class SediApp(tk.Frame):
         self.b_run = tk.Button(master, bg="white", text="Compute", width=30,
                                command=lambda: self.run_program())
         self.b_run.grid(sticky=tk.W, row=7, column=0, padx=self.padx, pady=self.pady)
+        self.b_cancel = tk.Button(master, text="Cancel", width=10, state="disabled",
+                                  command=lambda: self.cancel_program())
+        self.b_cancel.grid(sticky=tk.W, row=7, column=1, padx=self.padx, pady=self.pady)
+        self.progress_bar = ttk.Progressbar(master, orient="horizontal", length=300, mode="determinate")
+        self.progress_bar.grid(column=0, columnspan=3, row=9, padx=self.padx, pady=self.pady, sticky=tk.W)
+        self.worker = None  # computation thread
+        self.cancel_event = threading.Event()
+        self.messages = queue.Queue()  # (message type, content) tuples from the computation thread
         self.grain_label = tk.Label(master, text="Grain file (csv): " + self.grain_file)
         self.grain_label.grid(column=0, columnspan=3, row=1, padx=self.padx, pady=self.pady, sticky=tk.W)
         self.hec_label = tk.Label(master, text="HEC-RAS data file (xlsx): " + self.hec_file)
@@ -81,7 +91,7 @@ class SediApp(tk.Frame):
 
         # update and enable combobox
         self.cbx_D_char['state'] = 'readonly'
-        self.cbx_D_char['values'] = list(self.grain_info.size_classes.index)
+        self.cbx_D_char['values'] = list(self.grain_info.size_classes.index) + ["ALL"]
         self.cbx_D_char.set('D84')
 
     def set_hec_file(self):
@@ -111,18 +121,77 @@ class SediApp(tk.Frame):
         if not self.valid_selections():
             return -1
 
-        # get selected characteristic grain size
+        # get selected characteristic grain size (ALL = fractional transport of all grain classes)
         try:
-            D_char = float(self.grain_info.size_classes["size"][str(self.cbx_D_char.get())])
+            if str(self.cbx_D_char.get()) == "ALL":
+                D_char = self.grain_info.size_classes["size"].astype(float)
+            else:
+                D_char = float(self.grain_info.size_classes["size"][str(self.cbx_D_char.get())])
         except ValueError:
             showinfo("ERROR", "The selected characteristic grain size is not correctly defined in the csv file (float?).")
             return -1
         if askokcancel("Start calculation?", "Click OK to start the calculation."):
-            sed.main(D_char, self.hec_file, self.out_folder)
+            self.cancel_event.clear()
+            self.b_run.config(state="disabled")
+            self.b_cancel.config(state="normal")
+            self.progress_bar.config(value=0, maximum=100)
+            self.run_label.config(fg="forest green", text="Running ...")
+            # compute in a background thread; Tk widgets are only updated by poll_worker
+            self.worker = threading.Thread(target=self.compute, args=(D_char,), daemon=True)
+            self.worker.start()
+            self.after(100, self.poll_worker)
+
+    def compute(self, D_char):
+        # runs in the worker thread: never touch Tk widgets here, only put messages on the queue
+        try:
+            # the whole workbook is loaded through the HecSet cache (fast recomputes of the same workbook);
+            # without valid cache, progress is reported and cancel is checked per chunk of read rows
+            out_file = sed.main(D_char, self.hec_file, self.out_folder,
+                                progress=lambda done, total: self.messages.put(("progress", (done, total))),
+                                cancel=self.cancel_event)
+            self.messages.put(("done", out_file))
+        except Exception as e:
+            self.messages.put(("error", e))
+
+    def poll_worker(self):
+        try:
+            while True:
+                message, content = self.messages.get_nowait()
+                if message == "progress":
+                    done, total = content
+                    if total:
+                        self.progress_bar.config(maximum=total, value=min(done, total))
+                    self.run_label.config(text="Processed %i rows ..." % done)
+                elif message == "done":
+                    self.finish(content)
+                    return
+                else:
+                    self.finish(None, error=content)
+                    return
+        except queue.Empty:
+            pass
+        self.after(100, self.poll_worker)
+
+    def finish(self, out_file, error=None):
+        self.b_run.config(state="normal")
+        self.b_cancel.config(state="disabled")
+        self.worker = None
+        if error is not None:
+            self.run_label.config(fg="red", text="Error: %s" % str(error))
+            showinfo("ERROR", "The calculation failed:\n%s" % str(error))
+        elif out_file is None:
+            self.run_label.config(fg="red", text="Cancelled.")
+        else:
             self.b_run.config(fg="forest green")
-            self.run_label.config(text="Success: Created %s" % str(self.out_folder + "/bed_load_mpm.xlsx"))
-            webbrowser.open(self.out_folder + "/bed_load_mpm.xlsx")
+            self.progress_bar.config(value=self.progress_bar["maximum"])
+            self.run_label.config(fg="forest green", text="Success: Created %s" % str(out_file))
+            webbrowser.open(out_file)
 
+    def cancel_program(self):
+        # the computation stops after the current chunk of read rows or after computing
+        self.cancel_event.set()
+        self.b_cancel.config(state="disabled")
+        self.run_label.config(text="Cancelling ...")
 
 if __name__ == '__main__':
     SediApp().mainloop()
@@ -1,12 +1,166 @@
-import pandas as pd
+import hashlib
+import json
+import logging
+import os
+import numpy as np
+from fun import lazy_import
+
+pd = lazy_import("pandas")  # loaded at first use
+
+
+def get_profiles(hec_df):
+    # rows with a river station (skips e.g. empty rows between HEC-RAS reaches)
+    return hec_df[np.char.lower(hec_df["River Sta"].to_numpy().astype(str)) != "nan"]
+
+
+def to_json_value(value):
+    # numpy scalars and pd.NA in text columns (other objects such as dates raise a TypeError)
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is pd.NA:
+        return None
+    raise TypeError("Cannot store %s in the workbook cache." % type(value).__name__)
 
 
 class HecSet:
-    def __init__(self, xlsx_file_name="output.xlsx"):
+    def __init__(self, xlsx_file_name="output.xlsx", use_cache=True, progress=None, cancel=None, chunk_size=5000):
+        # progress: optional callback(rows_read, rows_total) and cancel: optional threading.Event; with
+        # either of them, a workbook without valid cache is read in HecStream chunks of chunk_size rows that
+        # report progress and stop reading when cancel is set (hec_data is None after cancelling)
         self.hec_data = pd.DataFrame
+        self.parse_options = {"skiprows": [1], "header": [0]}
+        # columnar npz cache next to the workbook (e.g., output.xlsx.cache.npz)
+        self.use_cache = use_cache
+        self.cache_file = str(xlsx_file_name) + ".cache.npz"
+        self.progress = progress
+        self.cancel = cancel
+        self.chunk_size = chunk_size
         self.get_hec_data(xlsx_file_name)
 
+    def read_workbook(self, xlsx_file_name):
+        if self.progress is None and self.cancel is None:
+            return pd.read_excel(xlsx_file_name, **self.parse_options)
+        hec_stream = HecStream(xlsx_file_name, chunk_size=self.chunk_size)
+        n_total = hec_stream.count_rows() if self.progress else None
+        chunks = []
+        n_done = 0
+        for chunk_df in hec_stream:
+            chunks.append(chunk_df)
+            n_done += chunk_df.shape[0]
+            if self.progress:
+                self.progress(n_done, n_total)
+            if self.cancel is not None and self.cancel.is_set():
+                logging.warning("CANCELLED WORKBOOK READ AFTER {0} ROWS".format(str(n_done)))
+                return None
+        return pd.concat(chunks, ignore_index=True) if chunks else pd.read_excel(xlsx_file_name, **self.parse_options)
+
+    def get_cache_key(self, xlsx_file_name):
+        # content hash of the workbook plus everything that changes the parsed data frame
+        file_hash = hashlib.sha256()
+        with open(xlsx_file_name, "rb") as f:
+            for block in iter(lambda: f.read(2 ** 20), b""):
+                file_hash.update(block)
+        file_hash.update(repr(sorted(self.parse_options.items())).encode())
+        file_hash.update(pd.__version__.encode())
+        return file_hash.hexdigest()
+
     def get_hec_data(self, xlsx_file_name):
-        self.hec_data = pd.read_excel(xlsx_file_name,
-                                     skiprows=[1],
-                                     header=[0])
\ No newline at end of file
+        if not self.use_cache:
+            self.hec_data = self.read_workbook(xlsx_file_name)
+            return
+
+        cache_key = self.get_cache_key(xlsx_file_name)
+        try:
+            hec_data = self.read_cache(cache_key)
+            if hec_data is not None:
+                self.hec_data = hec_data
+                return
+            logging.info("Workbook changed - updating cache %s." % self.cache_file)
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logging.warning("Could not read cache %s (ignored)." % self.cache_file)
+
+        self.hec_data = self.read_workbook(xlsx_file_name)
+        if self.hec_data is None:
+            return
+        try:
+            self.write_cache(cache_key)
+        except (OSError, TypeError, ValueError):
+            logging.warning("Could not write cache %s." % self.cache_file)
+
+    def read_cache(self, cache_key):
+        # data frame from the npz cache or None if its key does not match; the archive is loaded with
+        # allow_pickle=False, so that a foreign cache file can never execute code
+        with np.load(self.cache_file, allow_pickle=False) as cache:
+            meta = json.loads(str(cache["meta"]))
+            if meta["key"] != cache_key:
+                return None
+            columns = {}
+            for i, (name, dtype) in enumerate(zip(meta["columns"], meta["dtypes"])):
+                if dtype is None:
+                    columns[name] = cache["c%i" % i]
+                else:
+                    # text and mixed columns are JSON lists (NaN and None are kept apart)
+                    columns[name] = pd.Series(json.loads(str(cache["c%i" % i])), dtype=dtype)
+        return pd.DataFrame(columns, columns=meta["columns"])
+
+    def write_cache(self, cache_key):
+        # one npz member per column: numeric, boolean and datetime columns as native arrays, all other
+        # columns as JSON text; column names, dtypes and the cache key are stored in the JSON member "meta"
+        arrays = {}
+        dtypes = []
+        for i, (name, column) in enumerate(self.hec_data.items()):
+            if isinstance(column.dtype, np.dtype) and column.dtype.kind in "biufmM":
+                arrays["c%i" % i] = column.to_numpy()
+                dtypes.append(None)
+            else:
+                arrays["c%i" % i] = np.array(json.dumps(column.astype(object).tolist(), default=to_json_value))
+                dtypes.append(str(column.dtype))
+        meta = {"key": cache_key, "columns": list(self.hec_data.columns), "dtypes": dtypes}
+        # written completely before it replaces an older cache
+        temp_file = self.cache_file + ".tmp.npz"
+        np.savez(temp_file, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(temp_file, self.cache_file)
+
+
+class HecStream:
+    def __init__(self, xlsx_file_name="output.xlsx", chunk_size=5000):
+        # iterate over a HEC-RAS workbook in data frames of chunk_size rows (bounded memory)
+        self.xlsx_file_name = xlsx_file_name
+        self.chunk_size = chunk_size
+
+    def count_rows(self):
+        # number of data rows from the stored sheet dimensions (None if the workbook has none)
+        from openpyxl import load_workbook
+        wb = load_workbook(self.xlsx_file_name, read_only=True)
+        try:
+            max_row = wb.active.max_row
+        finally:
+            wb.close()
+        return None if max_row is None else max(max_row - 2, 0)
+
+    def __iter__(self):
+        from openpyxl import load_workbook
+        wb = load_workbook(self.xlsx_file_name, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            # same layout as HecSet: header in the first row, units in the second row
+            header = next(rows)
+            next(rows, None)
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) == self.chunk_size:
+                    yield self.to_frame(chunk, header)
+                    chunk = []
+            if chunk:
+                yield self.to_frame(chunk, header)
+        finally:
+            wb.close()
+
+    @staticmethod
+    def to_frame(rows, header):
+        # empty cells are None in openpyxl and NaN in pd.read_excel
+        chunk_df = pd.DataFrame(rows, columns=header).infer_objects()
+        return chunk_df.mask(chunk_df.isna(), np.nan)
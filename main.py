@@ -2,59 +2,209 @@ import os
 from grains import GrainReader
 from hec import *
 from mpm import *
+from formulas import *
+from writer import *
+from ensemble import *
+from critical import *
 
 #def get_char_grain_size(file_name=str, D_char=str):
 #    grain_info = GrainReader(file_name)
 #    return grain_info.size_classes["size"][D_char]
 
 
-def calculate_mpm(hec_df, D_char):
-    # create dictionary with relevant information about bed load transport with void lists
+def validity_report(section_mpm, hec_df):
+    # one row per profile that violates at least one MPM validity rule with one True/False column per rule
+    # (True if any grain class of the profile violates the rule in fractional mode)
+    report = pd.DataFrame({name: np.any(invalid, axis=tuple(range(1, invalid.ndim)))
+                           for name, invalid in section_mpm.validity.items()})
+    report.insert(0, "River Sta", hec_df["River Sta"].to_numpy())
+    report.insert(1, "Scenario", hec_df["Profile"].to_numpy())
+    return report[report[list(section_mpm.validity.keys())].any(axis=1)].reset_index(drop=True)
+
+
+def write_validity_report(section_mpm, hec_df, report_file=None):
+    # log a summary of the validity_report and write it to report_file (csv file name or csv StreamWriter)
+    report = validity_report(section_mpm, hec_df)
+    logging.info("VALIDITY RANGE VIOLATIONS: {0} of {1} PROFILES ({2})".format(
+        str(report.shape[0]), str(hec_df.shape[0]), ", ".join("%s: %i" % (name, np.count_nonzero(report[name]))
+                                                             for name in section_mpm.validity.keys())))
+    if isinstance(report_file, StreamWriter):
+        report_file.append(report)
+    elif report_file:
+        report.to_csv(report_file, index=False)
+    return report
+
+
+def calculate_mpm(hec_df, D_char, formulas=None, report_file=None, verbose=False):
+    # formulas is an optional list of registered bed load formulas (see BED_LOAD_FORMULAS) given as
+    # names or (name, params) tuples, e.g. ["MPM", ("Smart-Jaeggi", {"D90_D30": 2.0})];
+    # all formulas are evaluated on the same hydraulic arrays in one pass
+    # report_file is an optional csv file (or a csv StreamWriter of stream_mpm) for the validity_report;
+    # verbose=True logs every profile
+    # skip rows without river station
+    hec_df = get_profiles(hec_df)
+    logging.info("PROCESSING {0} PROFILES".format(str(hec_df.shape[0])))
+
+    # extract relevant hydraulic data from HEC-RAS output file as arrays
+    h = hec_df["Hydr Depth"].to_numpy(dtype=float)
+    Q = hec_df["Q Total"].to_numpy(dtype=float)
+    section_mpm = MPMArray(grain_size=D_char,
+                           Froude=hec_df["Froude # Chl"].to_numpy(dtype=float),
+                           water_depth=h,
+                           velocity=hec_df["Vel Chnl"].to_numpy(dtype=float),
+                           Q=Q,
+                           hydraulic_radius=hec_df["Hydr Radius"].to_numpy(dtype=float),
+                           slope=hec_df["E.G. Slope"].to_numpy(dtype=float))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        b = hec_df["Flow Area"].to_numpy(dtype=float) / h
+
+    # validity diagnostics (one summary for all rows instead of one warning per row)
+    report = write_validity_report(section_mpm, hec_df, report_file)
+    if verbose:
+        for sta, scenario in zip(hec_df["River Sta"], hec_df["Profile"]):
+            logging.info("PROCESSING PROFILE {0} FOR SCENARIO {1}".format(str(sta), str(scenario)))
+        for row in report.itertuples(index=False):
+            logging.warning("Profile {0} ({1}) out of validity range: {2}".format(
+                str(row[0]), str(row[1]), ", ".join(name for name, invalid in zip(report.columns[2:], row[2:]) if invalid)))
+
+    # create dictionary with relevant information about bed load transport
     mpm_dict = {
-            "River Sta": [],
-            "Scenario": [],
-            "Q (m3/s)": [],
-            "Phi (-)": [],
-            "Qb (kg/s)": []
+            "River Sta": hec_df["River Sta"].to_numpy(),
+            "Scenario": hec_df["Profile"].to_numpy(),
+            "Q (m3/s)": Q
     }
-
-    # extract relevant hydraulic data from HEC-RAS output file
-    Froude = hec_df["Froude # Chl"]
-    h = hec_df["Hydr Depth"]
-    Q = hec_df["Q Total"]
-    Rh = hec_df["Hydr Radius"]
-    Se = hec_df["E.G. Slope"]
-    u = hec_df["Vel Chnl"]
-
-    for i, sta in enumerate(list(hec_df["River Sta"])):
-        if not str(sta).lower() == "nan":
-            logging.info("PROCESSING PROFILE {0} FOR SCENARIO {1}".format(str(hec_df["River Sta"][i]), str(hec_df["Profile"][i])))
-            mpm_dict["River Sta"].append(hec_df["River Sta"][i])
-            mpm_dict["Scenario"].append(hec_df["Profile"][i])
-            section_mpm = MPM(grain_size=D_char,
-                              Froude=Froude[i],
-                              water_depth=h[i],
-                              velocity=u[i],
-                              Q=Q[i],
-                              hydraulic_radius=Rh[i],
-                              slope=Se[i])
-            mpm_dict["Q (m3/s)"].append(Q[i])
-            mpm_dict["Phi (-)"].append(section_mpm.phi)
-            b = hec_df["Flow Area"][i] / h[i]
-            mpm_dict["Qb (kg/s)"].append(section_mpm.add_dimensions(b))
+    if formulas is None:
+        mpm_dict["Phi (-)"] = section_mpm.phi
+        mpm_dict["Qb (kg/s)"] = section_mpm.add_dimensions(b)
+    else:
+        for formula in formulas:
+            name, params = (formula, {}) if isinstance(formula, str) else formula
+            phi = section_mpm.evaluate(name, **params)
+            mpm_dict["Phi {0} (-)".format(name)] = phi
+            mpm_dict["Qb {0} (kg/s)".format(name)] = section_mpm.add_dimensions(b, phi)
     return pd.DataFrame(mpm_dict)
 
 
-@log_actions
-def main(D_char, hec_file, out_folder):
-    # get characteristic grain size = D84
+def calculate_mpm_fractional(hec_df, grain_sizes, report_file=None):
+    # grain_sizes is a pandas Series of grain sizes (m) indexed by class name, such as
+    # GrainReader.size_classes["size"]; all classes are broadcast against all profiles at once
+    # report_file: optional csv file for the validity_report (a profile violates a rule if any class does)
+    hec_df = get_profiles(hec_df)
+    logging.info("PROCESSING {0} PROFILES FOR {1} GRAIN CLASSES".format(str(hec_df.shape[0]), str(grain_sizes.size)))
+
+    # profiles along axis 0, grain classes along axis 1
+    D = grain_sizes.to_numpy(dtype=float)[np.newaxis, :]
+    h = hec_df["Hydr Depth"].to_numpy(dtype=float)[:, np.newaxis]
+    Q = hec_df["Q Total"].to_numpy(dtype=float)
+    section_mpm = MPMArray(grain_size=D,
+                           Froude=hec_df["Froude # Chl"].to_numpy(dtype=float)[:, np.newaxis],
+                           water_depth=h,
+                           velocity=hec_df["Vel Chnl"].to_numpy(dtype=float)[:, np.newaxis],
+                           Q=Q[:, np.newaxis],
+                           hydraulic_radius=hec_df["Hydr Radius"].to_numpy(dtype=float)[:, np.newaxis],
+                           slope=hec_df["E.G. Slope"].to_numpy(dtype=float)[:, np.newaxis])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        b = hec_df["Flow Area"].to_numpy(dtype=float)[:, np.newaxis] / h
+    write_validity_report(section_mpm, hec_df, report_file)
+
+    # one row per profile and grain class (long form of the station x scenario x class cube)
+    n_classes = grain_sizes.size
+    index = pd.MultiIndex.from_arrays([np.repeat(hec_df["River Sta"].to_numpy(), n_classes),
+                                       np.repeat(hec_df["Profile"].to_numpy(), n_classes),
+                                       np.tile(grain_sizes.index.to_numpy(), hec_df.shape[0])],
+                                      names=["River Sta", "Scenario", "Class"])
+    return pd.DataFrame({
+            "D (m)": np.broadcast_to(D, section_mpm.phi.shape).ravel(),
+            "Q (m3/s)": np.repeat(Q, n_classes),
+            "Phi (-)": section_mpm.phi.ravel(),
+            "Qb (kg/s)": section_mpm.add_dimensions(b).ravel()
+    }, index=index)
+
+
+def mpm_cube(fractional_results, column="Qb (kg/s)"):
+    # reshape calculate_mpm_fractional results to a (stations, scenarios, classes) numpy array;
+    # missing station-scenario combinations are NaN
+    stations, scenarios, classes = [fractional_results.index.get_level_values(level).unique()
+                                    for level in ["River Sta", "Scenario", "Class"]]
+    full_index = pd.MultiIndex.from_product([stations, scenarios, classes], names=fractional_results.index.names)
+    cube = fractional_results[column].reindex(full_index).to_numpy(dtype=float)
+    return cube.reshape(stations.size, scenarios.size, classes.size), stations, scenarios, classes
+
+
+def stream_mpm(hec_file, D_char, out_file, chunk_size=5000, formulas=None, progress=None, cancel=None,
+               report_file=None):
+    # read, compute and write chunk_size HEC-RAS rows at a time so that peak memory does not
+    # depend on the workbook size; out_file can be a csv or xlsx file (see StreamWriter)
+    # progress: optional callback(rows_done, rows_total) called after every chunk
+    # cancel: optional threading.Event that stops the computation after the current chunk; out_file
+    # and report_file (optional csv file for the validity_report of all chunks) are only replaced
+    # when all chunks were written
+    hec_stream = HecStream(hec_file, chunk_size=chunk_size)
+    n_total = hec_stream.count_rows() if progress else None
+    writers = [StreamWriter(out_file)]
+    if report_file:
+        writers.append(StreamWriter(report_file, index=False))
+    n_done = 0
+    try:
+        for chunk_df in hec_stream:
+            chunk_results = calculate_mpm(chunk_df, D_char, formulas=formulas,
+                                          report_file=writers[1] if report_file else None)
+            chunk_results.index += writers[0].n_rows
+            writers[0].append(chunk_results)
+            n_done += chunk_df.shape[0]
+            if progress:
+                progress(n_done, n_total)
+            if cancel is not None and cancel.is_set():
+                logging.warning("CANCELLED AFTER {0} ROWS".format(str(n_done)))
+                for writer in writers:
+                    writer.discard()
+                return None
+    except Exception:
+        for writer in writers:
+            writer.discard()
+        raise
+    for writer in writers:
+        writer.close()
+    logging.info("WROTE {0} PROFILES TO {1}".format(str(writers[0].n_rows), str(out_file)))
+    return writers[0].n_rows
+
+
+@log_actions(asynchronous=True, instrument=True)
+def main(D_char, hec_file, out_folder, chunk_size=None, out_format="xlsx", progress=None, cancel=None):
+    # get characteristic grain size = D84 (or a Series of all grain classes for fractional transport)
     #D_char = get_char_grain_size(file_name=os.path.abspath("..") + "\\grains.csv", D_char="D84")
-    hec_file = os.path.abspath("..") + "\\HEC-RAS\\output.xlsx"
-    hec = HecSet(hec_file)
+    # progress and cancel: see stream_mpm (without chunk_size, progress is reported per chunk while a workbook
+    # without valid cache is read, see HecSet, and after computing)
+    # out_format: xlsx, csv, parquet or npz (streaming mode: xlsx or csv)
+    out_file = os.path.join(out_folder, "bed_load_mpm." + out_format.strip("."))
+    report_file = os.path.join(out_folder, "bed_load_mpm_validity.csv")
+    if chunk_size:
+        # streaming mode with bounded memory for very large workbooks
+        with stage("streamed workbook load, MPM compute and write"):
+            n_rows = stream_mpm(hec_file, D_char, out_file, chunk_size=chunk_size, progress=progress, cancel=cancel,
+                                report_file=report_file)
+        if n_rows is None:
+            return None
+        return out_file
+    with stage("workbook load"):
+        hec = HecSet(hec_file, progress=progress, cancel=cancel)
+    if hec.hec_data is None or (cancel is not None and cancel.is_set()):
+        return None
     logging.info(hec.hec_data.head())
+    n_total = hec.hec_data.shape[0]
 
-    mpm_results = calculate_mpm(hec.hec_data, D_char)
-    mpm_results.to_excel(os.path.abspath("..") + "\\bed_load_mpm.xlsx")
+    with stage("MPM compute"):
+        if isinstance(D_char, pd.Series):
+            mpm_results = calculate_mpm_fractional(hec.hec_data, D_char, report_file=report_file)
+        else:
+            mpm_results = calculate_mpm(hec.hec_data, D_char, report_file=report_file)
+    if progress:
+        progress(n_total, n_total)
+    if cancel is not None and cancel.is_set():
+        return None
+    with stage("result write"):
+        write_results(mpm_results, out_file)
+    return out_file
 
 
 if __name__ == '__main__':